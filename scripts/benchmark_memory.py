@@ -0,0 +1,134 @@
+"""Measure the memory held by the tasks and the variables of a large synthetic manifest (development only).
+
+    python scripts/benchmark_memory.py --tasks 20000 --variables 100000 --variableStore memory
+"""
+from logging import Logger
+from typing import List
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import yaml
+
+_CAPABILITIES = ['build', 'test', 'deploy']
+_TEMPLATE_TASKS = 10
+
+def synthetic_manifest(directory: str, tasks: int, variables: int) -> dict:
+    """Write a manifest of `tasks` tasks, half of them included from a template, and a config file
+    of `variables` variables grouped by 100, and return the options of a run"""
+    config = {}
+    for index in range(variables):
+        config.setdefault(f'group{index // 100}', {})[f'key{index % 100}'] = f'value-{index}'
+    with open(os.path.join(directory, 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f)
+
+    template = os.path.join(directory, 'template.yaml')
+    with open(template, 'w') as f:
+        yaml.safe_dump({ 'tasks': [{
+            'task': 'echo',
+            'displayName': f'templated {index}',
+            'steps': ['run'],
+            'parameters': { 'message': '${{ greeting }}', 'retries': 3, 'tags': ['synthetic', 'template'] }
+        } for index in range(_TEMPLATE_TASKS)] }, f)
+
+    perCapability = max(tasks // len(_CAPABILITIES), 1)
+    capabilities = { capability: None for capability in ['code', 'release', 'operate', 'monitor', 'plan'] }
+    for capability in _CAPABILITIES:
+        solutionTasks = []
+        for index in range(perCapability // 2):
+            solutionTasks.append({
+                'task': 'echo',
+                'displayName': f'{capability} task {index}',
+                'steps': ['pre', 'run'] if index % 2 == 0 else ['run'],
+                'parameters': { 'message': f'${{{{ group{index % max(variables // 100, 1)}_key{index % 100} }}}}', 'retries': 3 },
+                'condition': "${{ greeting }} == 'hello'" if index % 5 == 0 else None
+            })
+        for index in range((perCapability - perCapability // 2) // _TEMPLATE_TASKS):
+            solutionTasks.append({ 'template': template, 'displayName': f'{capability} {index}' })
+        capabilities[capability] = { 'solutions': [{ 'solution': 'synthetic', 'tasks': solutionTasks }] }
+
+    variablesSection = [{ 'name': 'greeting', 'value': 'hello' }]
+    for capability in _CAPABILITIES:
+        variablesSection.append({ 'name': f'{capability}_enable', 'value': True })
+        variablesSection.append({ 'name': f'{capability}_solution', 'value': 'synthetic' })
+    manifest = os.path.join(directory, 'manifest.yaml')
+    with open(manifest, 'w') as f:
+        yaml.safe_dump({ 'variables': variablesSection, 'requirements': [], 'capabilities': capabilities }, f)
+    return {
+        'manifest': manifest,
+        'steps': "['run:all']",
+        'configFiles': repr([os.path.join(directory, 'config.yaml')]),
+        'extraVariables': '{}',
+        'outputContext': None,
+        'metricsStore': 'none'
+    }
+
+class MemoryBenchmark:
+    """Measure the memory held by the model of a large synthetic manifest: the tasks once the manifest is
+    loaded, then the variables once they are all materialized"""
+    _logger: Logger
+    results: List[tuple]
+
+    def __init__(self, logger: Logger, tasks: int, variables: int, variableStore: str = 'memory') -> None:
+        self._logger = logger
+        self.tasks = tasks
+        self.variables = variables
+        self.variableStore = variableStore
+        self.results = []
+
+    def run(self) -> List[tuple]:
+        # imported here as the engine itself imports the models measured
+        from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+        from lemniscat.runtime.plugin.pluginmanager import PluginManager
+        directory = tempfile.mkdtemp(prefix='lemniscat-benchmark-')
+        try:
+            options = synthetic_manifest(directory, self.tasks, self.variables)
+            options['verbosity'] = 'ERROR'
+            options['variableStore'] = self.variableStore
+            plugins = PluginManager({ 'manifest': None, 'verbosity': 'ERROR', 'requirements': [] })
+            gc.collect()
+            tracemalloc.start()
+            started = time.perf_counter()
+            engine = OrchestratorEngine(options=options, plugins=plugins)
+            loaded = time.perf_counter() - started
+            gc.collect()
+            manifestMemory = tracemalloc.get_traced_memory()[0]
+            planned = len(engine.plan())
+            variables = engine._bagOfVariables._variables
+            for key in variables.pending():
+                variables[key]
+            engine._bagOfVariables.interpret()
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.results = [
+                ('tasks planned', f'{planned}'),
+                ('variables', f'{len(variables)}'),
+                ('load time', f'{loaded:.2f}s'),
+                ('memory after load', f'{manifestMemory / 1048576:.1f} MiB'),
+                ('memory with all variables', f'{current / 1048576:.1f} MiB'),
+                ('peak memory', f'{peak / 1048576:.1f} MiB')
+            ]
+            engine._bagOfVariables.close()
+            return self.results
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def to_text(self) -> str:
+        lines = [f'Synthetic manifest: {self.tasks} tasks, {self.variables} variables ({self.variableStore} store)']
+        lines.extend([f'{name:<28}{value:>12}' for name, value in self.results])
+        return '\n'.join(lines)
+
+if __name__ == '__main__':
+    from lemniscat.core.util.helpers import LogUtil
+    parser = argparse.ArgumentParser(description="Measure the memory held by the tasks and the variables of a large synthetic manifest.")
+    parser.add_argument('--tasks', type=int, default=20000, help="Number of tasks of the synthetic manifest. The default is 20000")
+    parser.add_argument('--variables', type=int, default=100000, help="Number of variables of the synthetic config file. The default is 100000")
+    parser.add_argument('--variableStore', default='memory', help="Where the variables are kept: memory or sqlite. The default is memory")
+    args = parser.parse_args()
+    benchmark = MemoryBenchmark(LogUtil.create('ERROR'), args.tasks, args.variables, args.variableStore)
+    benchmark.run()
+    print(benchmark.to_text())
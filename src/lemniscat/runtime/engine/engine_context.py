@@ -0,0 +1,127 @@
+from typing import Iterable, Iterator, Tuple
+import json
+import mmap
+import os
+import struct
+import uuid
+from lemniscat.core.model.models import VariableValue
+from .engine_store import variable_value
+
+CONTEXT_SUFFIX = '.lemctx'
+
+_MAGIC = b'LEMCTX\x00\x01'
+# magic, number of variables, offset of the key index
+_HEADER = struct.Struct('<8sIQ')
+# offset and length of the key, offset and length of the value, flags
+_ENTRY = struct.Struct('<QIQIB')
+_SENSITIVE = 0x01
+
+def is_binary_context(path: str) -> bool:
+    return str(path).endswith(CONTEXT_SUFFIX)
+
+def encode_value(value) -> str:
+    """The JSON of a variable value in every output (journal, JSON or binary context): a value JSON cannot
+    represent is written as its string"""
+    return json.dumps(value, default=str)
+
+def write_binary_context(path: str, variables: Iterable[Tuple[str, VariableValue]]) -> int:
+    """Write the variables, sensitive ones included with their flag, followed by an index of the keys
+    sorted so a reader can look a key up in the mapped file without loading the others.
+    The file may hold secrets in clear: it is created readable by its owner only"""
+    entries = []
+    temporary = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    # created here, never opened if it already exists (e.g. a link planted in a shared directory)
+    descriptor = os.open(temporary, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, 0, 0))
+            for key, variable in variables:
+                encodedKey = str(key).encode('utf-8')
+                value = encode_value(variable.value).encode('utf-8')
+                keyOffset = f.tell()
+                f.write(encodedKey)
+                f.write(value)
+                entries.append((encodedKey, keyOffset, keyOffset + len(encodedKey), len(value), _SENSITIVE if variable.sensitive else 0))
+            entries.sort(key=lambda entry: entry[0])
+            indexOffset = f.tell()
+            for encodedKey, keyOffset, valueOffset, length, flags in entries:
+                f.write(_ENTRY.pack(keyOffset, len(encodedKey), valueOffset, length, flags))
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, len(entries), indexOffset))
+        os.replace(temporary, path)
+    except BaseException:
+        if(os.path.exists(temporary)):
+            os.remove(temporary)
+        raise
+    return len(entries)
+
+class BinaryContext:
+    """A binary context written by `lem`, mapped in memory. The keys are already flattened and the values
+    already interpreted: a value is only decoded when it is accessed"""
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            if(os.fstat(f.fileno()).st_size < _HEADER.size):
+                raise ValueError(f'Not a lemniscat context: {path}')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._indexOffset = _HEADER.unpack_from(self._map, 0)
+        if(magic != _MAGIC or self._indexOffset + self._count * _ENTRY.size != len(self._map)):
+            self._map.close()
+            raise ValueError(f'Not a lemniscat context: {path}')
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __entry(self, position: int) -> tuple:
+        return _ENTRY.unpack_from(self._map, self._indexOffset + position * _ENTRY.size)
+
+    def __key(self, position: int) -> bytes:
+        keyOffset, keyLength, _, _, _ = self.__entry(position)
+        return self._map[keyOffset:keyOffset + keyLength]
+
+    def keys(self) -> Iterator[str]:
+        index = memoryview(self._map)[self._indexOffset:]
+        try:
+            for keyOffset, keyLength, _, _, _ in _ENTRY.iter_unpack(index):
+                yield self._map[keyOffset:keyOffset + keyLength].decode('utf-8')
+        finally:
+            index.release()
+
+    def position(self, key: str) -> int:
+        """Return the position of a key in the index, or -1, by a binary search over the mapped index"""
+        encodedKey = key.encode('utf-8')
+        low, high = 0, self._count
+        while(low < high):
+            middle = (low + high) // 2
+            if(self.__key(middle) < encodedKey):
+                low = middle + 1
+            else:
+                high = middle
+        if(low < self._count and self.__key(low) == encodedKey):
+            return low
+        return -1
+
+    def __contains__(self, key: str) -> bool:
+        return self.position(key) >= 0
+
+    def encoded(self, position: int) -> Tuple[bytes, bool]:
+        """Return the JSON of a value and its sensitive flag, without decoding it"""
+        _, _, valueOffset, length, flags = self.__entry(position)
+        return (self._map[valueOffset:valueOffset + length], bool(flags & _SENSITIVE))
+
+    def variable(self, position: int) -> VariableValue:
+        value, sensitive = self.encoded(position)
+        return variable_value(json.loads(value), sensitive)
+
+    def get(self, key: str, default: VariableValue = None) -> VariableValue:
+        position = self.position(key)
+        return self.variable(position) if position >= 0 else default
+
+    def items(self) -> Iterator[Tuple[str, VariableValue]]:
+        for position, key in enumerate(self.keys()):
+            yield (key, self.variable(position))
+
+    def close(self) -> None:
+        self._map.close()
@@ -0,0 +1,115 @@
+from typing import Dict, List
+from .engine_metrics import percentile
+
+class Estimator:
+    """Estimate the duration and the critical path of a planned run from the metrics of previous runs"""
+    tasks: List[dict]
+    total: float
+    totalP95: float
+    unknown: int
+    criticalPath: List[str]
+    criticalDuration: float
+
+    def __init__(self, plan: List[dict], records: List[dict], predecessors: Dict[str, List[str]]) -> None:
+        history: Dict[tuple, List[float]] = {}
+        for record in records:
+            if(record['kind'] == 'task' and record['status'] != 'Failed'):
+                key = (record['capability'], record['solution'], record['step'], record['name'])
+                history.setdefault(key, []).append(record['duration'])
+
+        self.tasks = []
+        weights: Dict[str, float] = {}
+        for item in plan:
+            task = item['task']
+            durations = history.get((item['capability'], item['solution'], item['step'], task.displayName), [])
+            estimate = {
+                'capability': item['capability'],
+                'solution': item['solution'],
+                'step': item['step'],
+                'name': task.displayName,
+                'conditional': task.condition is not None,
+                'samples': len(durations),
+                'mean': sum(durations) / len(durations) if len(durations) > 0 else None,
+                'p95': percentile(durations, 95)
+            }
+            self.tasks.append(estimate)
+            group = self.__group(item)
+            weights[group] = weights.get(group, 0) + (estimate['mean'] or 0)
+
+        self.total = sum([task['mean'] or 0 for task in self.tasks])
+        self.totalP95 = sum([task['p95'] or 0 for task in self.tasks])
+        self.unknown = len([task for task in self.tasks if task['samples'] == 0])
+        self.__critical_path(weights, predecessors)
+
+    @staticmethod
+    def __group(item: dict) -> str:
+        if(item['capability'] == 'global'):
+            return item['solution']
+        return item['capability']
+
+    def __critical_path(self, weights: Dict[str, float], predecessors: Dict[str, List[str]]) -> None:
+        """Longest chain of capabilities through their predecessors (see `Capabilities.predecessors`: the order
+        the engine runs them in, unless `dependsOn` lets them run in parallel), between the pre and post phases"""
+        capabilities = [group for group in weights.keys() if group not in ['pre', 'post']]
+        finish: Dict[str, float] = {}
+        previous: Dict[str, str] = {}
+        def finishing(capability: str) -> float:
+            # a capability without planned task (disabled, not selected...) takes no time but keeps the chain
+            if(capability in finish):
+                return finish[capability]
+            finish[capability] = 0
+            start = 0
+            for predecessor in predecessors.get(capability, []):
+                end = finishing(predecessor)
+                if(capability not in previous or end > start):
+                    start = end
+                    previous[capability] = predecessor
+            finish[capability] = start + weights.get(capability, 0)
+            return finish[capability]
+        for capability in capabilities:
+            finishing(capability)
+
+        path = []
+        if(len(capabilities) > 0):
+            # on ties prefer the last capability, which carries the longest chain
+            current = max(reversed(capabilities), key=finish.get)
+            seen = set()
+            while(current is not None and current not in seen):
+                seen.add(current)
+                if(current in weights):
+                    path.insert(0, current)
+                current = previous.get(current)
+        if('pre' in weights):
+            path.insert(0, 'pre')
+        if('post' in weights):
+            path.append('post')
+        self.criticalPath = path
+        self.criticalDuration = sum([weights[group] for group in path])
+
+    @staticmethod
+    def __format(value: float) -> str:
+        if(value is None):
+            return '        ?'
+        return f'{value:>8.2f}s'
+
+    def to_text(self) -> str:
+        header = f"{'item':<60} {'runs':>5} {'mean':>9} {'p95':>9}  "
+        lines = [header, '-' * len(header)]
+        for task in self.tasks:
+            parts = []
+            for field in ['capability', 'solution', 'step', 'name']:
+                if(len(parts) == 0 or parts[-1] != str(task[field])):
+                    parts.append(str(task[field]))
+            item = '/'.join(parts)
+            if(len(item) > 60):
+                item = '...' + item[-57:]
+            flags = []
+            if(task['conditional']):
+                flags.append('conditional')
+            if(self.__group(task) in self.criticalPath):
+                flags.append('critical')
+            lines.append(f"{item:<60} {task['samples']:>5} {self.__format(task['mean'])} {self.__format(task['p95'])}  {', '.join(flags)}")
+        lines.append('')
+        lines.append(f"Expected total: {self.total:.2f}s (p95: {self.totalP95:.2f}s) for {len(self.tasks)} tasks, {self.unknown} without history")
+        lines.append(f"Critical path: {' -> '.join(self.criticalPath)} ({self.criticalDuration:.2f}s)")
+        return '\n'.join(lines)
@@ -4,10 +4,13 @@ from typing import List
 class StepsParser:
     """The steps parser is responsible for parsing the steps"""
     _steps: List[str] = []
+    raw: List[str] = []
     isCleanSteps: bool = False
     _logger : Logger
 
     def __init__(self, logger: Logger, steps: List[str]) -> None:
+        self._steps = []
+        self.raw = list(steps)
         capabilities = List[str]
         for step in steps:
             parts = step.split(':')
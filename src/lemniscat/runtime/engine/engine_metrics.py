@@ -0,0 +1,211 @@
+from logging import Logger
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import json
+import os
+import time
+import uuid
+
+_DEFAULT_STORE = os.path.join('~', '.lemniscat', 'metrics.jsonl')
+_DISABLED = ['none', 'off', 'false']
+_DEFAULT = 'default'
+
+def percentile(values: List[float], rank: float) -> float:
+    """Linear interpolated percentile (rank between 0 and 100) of a list of values"""
+    if(len(values) == 0):
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class MetricsStore:
+    """An append-only JSON Lines store of the durations of previous runs"""
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+        self._file = None
+
+    @staticmethod
+    def from_option(option: Optional[str], record: bool = True) -> Optional['MetricsStore']:
+        """Build the store from the --metricsStore option or $LEM_METRICS_STORE, None when metrics are disabled.
+        Recording is opt-in; the commands only reading the store fall back to ~/.lemniscat/metrics.jsonl"""
+        if(option is None):
+            option = os.environ.get('LEM_METRICS_STORE', None if record else _DEFAULT_STORE)
+        if(option is None or option.strip() == '' or option.lower() in _DISABLED):
+            return None
+        if(option.lower() == _DEFAULT):
+            option = _DEFAULT_STORE
+        return MetricsStore(option)
+
+    def append(self, records: List[dict]) -> None:
+        if(self._file is None):
+            # opened on the first record and kept open until the end of the run
+            directory = os.path.dirname(self.path)
+            if(directory != ''):
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a')
+        for record in records:
+            self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        if(self._file is not None):
+            self._file.close()
+            self._file = None
+
+    def read(self, manifest: str = None) -> List[dict]:
+        records = []
+        if(not os.path.exists(self.path)):
+            return records
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if(line == ''):
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a run killed while writing leaves a truncated last line
+                    continue
+                if(manifest is None or record.get('manifest') == manifest):
+                    records.append(record)
+        return records
+
+class RunRecorder:
+    """Collect the durations of the current run and append them to the metrics store"""
+    _logger: Logger
+    _store: MetricsStore
+    run: str
+    manifest: str
+
+    def __init__(self, logger: Logger, store: Optional[MetricsStore], manifest: Optional[str]) -> None:
+        self._logger = logger
+        self._store = store
+        self.run = uuid.uuid4().hex
+        self.manifest = os.path.abspath(manifest) if manifest is not None else None
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def elapsed(self, started: float) -> float:
+        return RunRecorder.now() - started
+
+    def record(self, kind: str, name: str, status: str, duration: float, capability: str = None, solution: str = None, step: str = None, id: str = None) -> None:
+        if(self._store is None):
+            return
+        record = {
+            'run': self.run,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'manifest': self.manifest,
+            'kind': kind,
+            'capability': capability,
+            'solution': solution,
+            'step': step,
+            'id': id,
+            'name': name,
+            'status': status,
+            'duration': round(duration, 6)
+        }
+        try:
+            self._store.append([record])
+        except OSError as e:
+            self._logger.warning(f'Unable to write metrics to {self._store.path}: {e}')
+
+    def close(self) -> None:
+        if(self._store is not None):
+            self._store.close()
+
+class MetricsReport:
+    """Percentiles and regressions computed from the records of the metrics store"""
+    _GROUP_BY = ['manifest', 'kind', 'capability', 'solution', 'step', 'name']
+    rows: List[dict]
+
+    def __init__(self, records: List[dict], window: int = 20, threshold: float = 1.2, minDelta: float = 0.5) -> None:
+        groups: Dict[tuple, List[dict]] = {}
+        for record in records:
+            key = tuple(record.get(field) for field in self._GROUP_BY)
+            groups.setdefault(key, []).append(record)
+        self.rows = []
+        for key, items in groups.items():
+            items.sort(key=lambda x: x['timestamp'])
+            durations = [item['duration'] for item in items if item['status'] != 'Failed']
+            if(len(durations) == 0):
+                durations = [item['duration'] for item in items]
+            last = items[-1]
+            baseline = [item['duration'] for item in items[:-1] if item['status'] != 'Failed'][-window:]
+            baselineMedian = percentile(baseline, 50)
+            regression = (len(baseline) >= 3
+                and last['status'] != 'Failed'
+                and last['duration'] > baselineMedian * threshold
+                and last['duration'] - baselineMedian >= minDelta)
+            row = dict(zip(self._GROUP_BY, key))
+            row.update({
+                'count': len(items),
+                'samples': len(durations),
+                'failures': len([item for item in items if item['status'] == 'Failed']),
+                'mean': sum(durations) / len(durations),
+                'p50': percentile(durations, 50),
+                'p90': percentile(durations, 90),
+                'p95': percentile(durations, 95),
+                'max': max(durations),
+                'sum': sum(durations),
+                'last': last['duration'],
+                'baseline': baselineMedian,
+                'regression': regression
+            })
+            self.rows.append(row)
+        self.rows.sort(key=lambda x: tuple(str(x[field] or '') for field in self._GROUP_BY))
+
+    @property
+    def regressions(self) -> List[dict]:
+        return [row for row in self.rows if row['regression']]
+
+    def to_text(self) -> str:
+        header = f"{'kind':<10} {'item':<50} {'runs':>5} {'fail':>5} {'p50':>9} {'p90':>9} {'p95':>9} {'last':>9}  "
+        lines = [header, '-' * len(header)]
+        for row in self.rows:
+            parts = []
+            for field in ['capability', 'solution', 'step', 'name']:
+                if(row[field] is not None and (len(parts) == 0 or parts[-1] != str(row[field]))):
+                    parts.append(str(row[field]))
+            item = '/'.join(parts)
+            if(len(item) > 50):
+                item = '...' + item[-47:]
+            flag = '⚠ regression' if row['regression'] else ''
+            lines.append(f"{row['kind']:<10} {item:<50} {row['count']:>5} {row['failures']:>5} {row['p50']:>8.2f}s {row['p90']:>8.2f}s {row['p95']:>8.2f}s {row['last']:>8.2f}s  {flag}")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def __label(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def to_openmetrics(self) -> str:
+        lines = [
+            '# TYPE lemniscat_duration_seconds summary',
+            '# HELP lemniscat_duration_seconds Duration of lemniscat tasks, solutions, capabilities and plugin loads.',
+            '# UNIT lemniscat_duration_seconds seconds'
+        ]
+        regressions = [
+            '# TYPE lemniscat_regression gauge',
+            '# HELP lemniscat_regression 1 when the last run is slower than the baseline median.'
+        ]
+        for row in self.rows:
+            labels = ','.join([f'{field}="{self.__label(row[field])}"' for field in self._GROUP_BY if row[field] is not None])
+            for quantile, field in [('0.5', 'p50'), ('0.9', 'p90'), ('0.95', 'p95')]:
+                value = row[field]
+                lines.append(f'lemniscat_duration_seconds{{{labels},quantile="{quantile}"}} {value}')
+            lines.append(f'lemniscat_duration_seconds_sum{{{labels}}} {row["sum"]}')
+            lines.append(f'lemniscat_duration_seconds_count{{{labels}}} {row["samples"]}')
+            regressions.append(f'lemniscat_regression{{{labels}}} {1 if row["regression"] else 0}')
+        return '\n'.join(lines + regressions + ['# EOF']) + '\n'
+
+    def save_openmetrics(self, filePath: str) -> None:
+        # write then rename so the node exporter never scrapes a partial file
+        tmpPath = f'{filePath}.{os.getpid()}.tmp'
+        with open(tmpPath, 'w') as f:
+            f.write(self.to_openmetrics())
+        os.replace(tmpPath, filePath)
@@ -0,0 +1,210 @@
+from logging import Logger
+from typing import Iterable, Iterator, List, Tuple
+import json
+import os
+from lemniscat.core.model.models import VariableValue
+from .engine_context import BinaryContext, encode_value, is_binary_context, write_binary_context
+from .engine_store import variable_value
+
+_JOURNAL_SUFFIX = '.jsonl'
+_INDEX_SUFFIX = '.idx'
+
+def has_journal(path: str) -> bool:
+    """Whether the run writing this output context died midway, leaving its journal"""
+    return os.path.exists(f'{path}{_JOURNAL_SUFFIX}')
+
+def write_context(path: str, variables: Iterable[Tuple[str, VariableValue]]) -> int:
+    """Write the non-sensitive variables as a JSON object holding one key per line, and next to it
+    an index of the position of each value, so a reader can load a key without parsing the whole file"""
+    index = {}
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(b'{')
+            separator = b'\n'
+            for key, variable in variables:
+                if(variable.sensitive):
+                    continue
+                prefix = separator + json.dumps(key).encode('utf-8') + b': '
+                value = encode_value(variable.value).encode('utf-8')
+                f.write(prefix)
+                index[key] = [f.tell(), len(value)]
+                f.write(value)
+                separator = b',\n'
+            f.write(b'\n}')
+            size = f.tell()
+    except BaseException:
+        # the temporary file does not exist when it could not be created
+        if(os.path.exists(temporary)):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, path)
+    with open(f'{temporary}{_INDEX_SUFFIX}', 'w') as f:
+        json.dump({ 'size': size, 'keys': index }, f)
+    os.replace(f'{temporary}{_INDEX_SUFFIX}', f'{path}{_INDEX_SUFFIX}')
+    return len(index)
+
+def save_context(path: str, variables: Iterable[Tuple[str, VariableValue]]) -> int:
+    """Write the output context in the format given by its extension: binary for `.lemctx`, JSON otherwise"""
+    if(is_binary_context(path)):
+        return write_binary_context(path, variables)
+    return write_context(path, variables)
+
+class OutputContextWriter:
+    """Stream the output context while the run goes: the non-sensitive variables changed by each task
+    are appended as JSON Lines to `<path>.jsonl`, which is compacted into `<path>` at the end of the run.
+    The journal is truncated when the writer starts, so it never holds the variables of a previous run"""
+    _logger: Logger
+    path: str
+    journal: str
+
+    def __init__(self, logger: Logger, path: str) -> None:
+        self._logger = logger
+        self.path = path
+        self.journal = f'{path}{_JOURNAL_SUFFIX}'
+        self._file = open(self.journal, 'w')
+
+    def append(self, variables: dict) -> int:
+        """Append the changed variables to the journal, flushed so it survives a run dying midway"""
+        lines = [f'{{"key": {json.dumps(key)}, "value": {encode_value(variable.value)}}}' for key, variable in variables.items() if not variable.sensitive]
+        if(len(lines) == 0):
+            return 0
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        self._logger.debug(f"{len(lines)} variables appended to: {self.journal}")
+        return len(lines)
+
+    def compact(self, variables: Iterable[Tuple[str, VariableValue]]) -> int:
+        """Write the indexed output context from the final variables and drop the journal"""
+        count = save_context(self.path, variables)
+        self.close()
+        if(os.path.exists(self.journal)):
+            os.remove(self.journal)
+        return count
+
+    def close(self) -> None:
+        if(self._file is not None):
+            self._file.close()
+            self._file = None
+
+class OutputContextReader:
+    """Read an output context written by `lem`. With its index, only the requested keys are parsed.
+    A journal left next to it means the last run died midway: the journal is replayed instead of the
+    compacted file, which was written by an earlier run"""
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._index = None
+        self._values = None
+        if(has_journal(path)):
+            self._values = self.__replay(f'{path}{_JOURNAL_SUFFIX}')
+        elif(os.path.exists(path)):
+            self._index = self.__read_index()
+            if(self._index is None):
+                with open(path, 'r') as f:
+                    self._values = json.load(f)
+        else:
+            raise FileNotFoundError(path)
+
+    def __read_index(self) -> dict:
+        try:
+            with open(f'{self.path}{_INDEX_SUFFIX}', 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # an index not matching the file (e.g. written by another tool) is ignored
+        if(index.get('size') != os.path.getsize(self.path)):
+            return None
+        return index['keys']
+
+    @staticmethod
+    def __replay(journal: str) -> dict:
+        values = {}
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of a journal may be truncated
+                    break
+                values[entry['key']] = entry['value']
+        return values
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def keys(self) -> List[str]:
+        return list(self._index.keys() if self._index is not None else self._values.keys())
+
+    def __contains__(self, key: str) -> bool:
+        return key in (self._index if self._index is not None else self._values)
+
+    def __len__(self) -> int:
+        return len(self._index if self._index is not None else self._values)
+
+    def get(self, key: str, default=None):
+        if(self._index is None):
+            return self._values.get(key, default)
+        if(not key in self._index):
+            return default
+        offset, length = self._index[key]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def items(self, keys: List[str] = None) -> Iterator[Tuple[str, object]]:
+        """Iterate over the values of some keys (all by default), reading the file once in order"""
+        if(keys is None):
+            keys = self.keys()
+        if(self._index is None):
+            for key in keys:
+                if(key in self._values):
+                    yield (key, self._values[key])
+            return
+        with open(self.path, 'rb') as f:
+            for key in sorted([key for key in keys if key in self._index], key=lambda key: self._index[key][0]):
+                offset, length = self._index[key]
+                f.seek(offset)
+                yield (key, json.loads(f.read(length)))
+
+    def load(self, keys: List[str] = None) -> dict:
+        return dict(self.items(keys))
+
+class JournalContext:
+    """The journal left next to a binary context by a run which died midway, read like the binary context
+    it stands for: the values were already interpreted and are only decoded when accessed.
+    Sensitive variables are never journaled, so they are not recovered"""
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        values = OutputContextReader(path).load()
+        self._keys = list(values.keys())
+        self._values = [encode_value(values[key]).encode('utf-8') for key in self._keys]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def encoded(self, position: int) -> Tuple[bytes, bool]:
+        return (self._values[position], False)
+
+    def variable(self, position: int) -> VariableValue:
+        return variable_value(json.loads(self._values[position]), False)
+
+    def items(self) -> Iterator[Tuple[str, VariableValue]]:
+        for position, key in enumerate(self._keys):
+            yield (key, self.variable(position))
+
+    def close(self) -> None:
+        pass
+
+def open_binary_context(path: str):
+    """Open a binary context, or replay the journal left next to it by a run which died midway"""
+    if(has_journal(path)):
+        return JournalContext(path)
+    return BinaryContext(path)
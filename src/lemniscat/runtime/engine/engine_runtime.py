@@ -2,12 +2,26 @@ from logging import Logger
 from typing import List, Optional
 from .engine_manifest import StepsParser
 from .engine_variables import BagOfVariables
+from .engine_metrics import MetricsStore, RunRecorder
+from .engine_worker import WorkerClient, decode_variables, encode_index, encode_variables, worker_token
+from .engine_watch import IncrementalCache
+from .engine_template import CompiledTemplate
+from .engine_output import OutputContextWriter
+from .engine_shard import Sharding
+from .engine_watchdog import TaskInterrupted, Watchdog
 from lemniscat.runtime.plugin.pluginmanager import PluginManager
 from lemniscat.core.util.helpers import LogUtil, FileSystem
 from lemniscat.core.model import TaskResult
-from lemniscat.runtime.model.models import Capabilities, Solution, Phase
+from lemniscat.core.model.models import VariableValue
+from lemniscat.runtime.model.models import Capabilities, Solution, Phase, TaskStatus
 from dacite import ForwardReferenceError, MissingValueError, UnexpectedDataError, WrongTypeError
+from simpleeval import InvalidExpression, NameNotDefined
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import ast
+import queue
+import threading
+import time
+import yaml
 
 class OrchestratorEngine:
     """The orchestrator engine is the main entry point for the application"""
@@ -18,38 +32,62 @@ class OrchestratorEngine:
     _postTasks: Phase
     _steps: StepsParser
     plugins: PluginManager
+    _metrics: RunRecorder
+    _workers: List[str]
+    _incremental: IncrementalCache
+    _sharding: Sharding = None
+    _watchdog: Watchdog
+    _deadline: float = None
     _outputContextPath: str = None
+    _output: OutputContextWriter = None
+    __STEPS = ['pre', 'pre-clean', 'run', 'run-clean', 'post', 'post-clean']
 
     def __init__(self, **args) -> None:
         self._logger = LogUtil.create(args['options']['verbosity'])
-        self.plugins = PluginManager(args['options'])
-        self._bagOfVariables = BagOfVariables(self._logger, args['options'])
+        self.plugins = args.get('plugins') or PluginManager(args['options'])
+        # an injected plugin manager has already discovered its plugins
+        self._reloadPlugins = args.get('plugins') is None
+        self._incremental = args.get('incremental')
+        self._watchdog = args.get('watchdog') or Watchdog(self._logger)
+        self._bagOfVariables = args.get('bagOfVariables') or BagOfVariables(self._logger, args['options'])
         self._steps = StepsParser(self._logger, ast.literal_eval(args['options']['steps']))
-        self.__read_manifest(args['options']['manifest'])
+        self._capabilities = None
+        self._preTasks = None
+        self._postTasks = None
+        if(args['options']['manifest'] is not None):
+            self.__read_manifest(args['options']['manifest'])
         self._outputContextPath = args['options']['outputContext']
+        # a worker records its metrics under the manifest of the coordinator which sent the solution
+        self._metrics = RunRecorder(self._logger, MetricsStore.from_option(args['options'].get('metricsStore')), args['options'].get('metricsManifest') or args['options']['manifest'])
+        self._workers = ast.literal_eval(args['options'].get('workers') or '[]')
+        self._workerCa = args['options'].get('workerCa')
+        if(self._capabilities is not None):
+            self._sharding = Sharding.from_option(args['options'].get('shard'), self._capabilities.dependsOn)
 
     def __read_manifest(self, manifest_path) -> None:
         try:
             manifest_data = FileSystem.load_configuration_path(manifest_path)
-            capabilitiesData = manifest_data["capabilities"]
-            capabilitiesData = self._bagOfVariables.interpretManifest(capabilitiesData, excludeInterpret=['condition'])
+            # each section is compiled once, rendering it only looks up the referenced variables;
+            # the compiled sections are dropped once the model is built
+            compiled = { key: CompiledTemplate(manifest_data[key], excludeInterpret=['condition']) for key in ['capabilities', 'pre', 'post'] if manifest_data.get(key) }
+            capabilitiesData = self._bagOfVariables.render(compiled["capabilities"])
             self._capabilities = Capabilities(self._bagOfVariables._variables, **capabilitiesData)
             if(manifest_data.get("pre")):
-                preTasks = manifest_data["pre"]
-                preTasks = self._bagOfVariables.interpretManifest(preTasks, excludeInterpret=['condition'])
-                self._preTasks = Phase(self._bagOfVariables._variables, **preTasks)
+                preTasks = self._bagOfVariables.render(compiled["pre"])
+                self._preTasks = Phase(self._bagOfVariables._variables, name='pre', **preTasks)
             else:
                 self._preTasks = None
             if(manifest_data.get("post")):
-                postTasks = manifest_data["post"]
-                postTasks = self._bagOfVariables.interpretManifest(postTasks, excludeInterpret=['condition'])
-                self._postTasks = Phase(self._bagOfVariables._variables, **postTasks)
+                postTasks = self._bagOfVariables.render(compiled["post"])
+                self._postTasks = Phase(self._bagOfVariables._variables, name='post', **postTasks)
             else:
                 self._postTasks = None
         except FileNotFoundError as e:
-            self._logger.error('Unable to read configuration file', e)
+            self._logger.error(f'Unable to read configuration file: {e}')
+        except yaml.YAMLError as e:
+            self._logger.error(f'Unable to parse manifest file: {e}')
         except (NameError, ForwardReferenceError, UnexpectedDataError, WrongTypeError, MissingValueError) as e:
-            self._logger.error('Unable to parse plugin configuration to data class', e)
+            self._logger.error(f'Unable to parse plugin configuration to data class: {e}')
         return None
     
     def __evalTaskCondition(self, capability: str, condition: str) -> bool:
@@ -58,115 +96,376 @@ class OrchestratorEngine:
         if(isinstance(condition, str)):
             return self._bagOfVariables.interpretEvalCondition(condition)
     
-    def __runTasks(self, step: str, capability: str, solution: Solution) -> None:
-        if(solution.status == 'Failed'):
+    def __runTasks(self, step: str, capability: str, solution: Solution, solutionName: str = None) -> None:
+        if(solution.status == TaskStatus.FAILED):
             return
         for task in solution.tasks_byStep(step):
             if(self._steps.get(step, capability)):
                 if(task.condition is None or self.__evalTaskCondition(capability, task.condition) == True):
+                    if(self._incremental is not None):
+                        key = self._incremental.key(capability, solutionName, step, task)
+                        fingerprint = self._incremental.fingerprint(task, self._bagOfVariables._variables.for_capability(capability))
+                        outputs = self._incremental.outputs(key, fingerprint)
+                        if(outputs is not None):
+                            self._logger.info(f'     |->🚀 [{step}] Up to date task: {task.displayName}')
+                            self._bagOfVariables.append(outputs)
+                            self._bagOfVariables.interpret()
+                            task.status = TaskStatus.FINISHED
+                            self.__streamOutput()
+                            continue
+                        before = self._incremental.snapshot(self._bagOfVariables._variables)
                     self._logger.info(f'     |->🚀 [{step}] Running task: {task.displayName}')
                     self._logger.debug(f'    |->🚀 [{step}] Running task: {task.id}')
-                    taskResult = self.__invoke_on_plugin(task.name, task.parameters, self._bagOfVariables.get_all_for_capability(capability))
+                    started = RunRecorder.now()
+                    taskResult = self.__invoke_on_plugin(task.name, task.parameters, self._bagOfVariables.get_all_for_capability(capability), self.__timeout(task))
                     if(taskResult.status == 'Failed'):
-                        task.status = 'Failed'
-                        solution.status = 'Failed'
+                        task.status = TaskStatus.FAILED
+                        solution.status = TaskStatus.FAILED
+                        elapsed = self._metrics.elapsed(started)
+                        self._logger.error(f'     |->❌ [{step}] Failed task: {task.displayName} after {elapsed:.2f}s')
+                        self._metrics.record('task', task.displayName, task.status, elapsed, capability, solutionName, step, task.id)
+                        if(self._incremental is not None):
+                            self._incremental.discard(key)
                         break
                     else:
                         self._bagOfVariables.interpret();    
-                        task.status = 'Finished'
+                        task.status = TaskStatus.FINISHED
+                        self.__streamOutput()
+                        self._metrics.record('task', task.displayName, task.status, self._metrics.elapsed(started), capability, solutionName, step, task.id)
+                        if(self._incremental is not None):
+                            self._incremental.store(key, fingerprint, before, self._bagOfVariables._variables)
                 else:
                     self._logger.info(f'    |->🚀 [{step}] Skipping task: {task.displayName}')
                     self._logger.debug(f'    |->🚀 [{step}] Running task: {task.id}')
                      
+    def __timeout(self, task) -> Optional[float]:
+        """Return the time left to the task: its own timeout, bounded by the one of its capability"""
+        timeouts = []
+        if(task.timeout is not None):
+            timeouts.append(float(task.timeout))
+        if(self._deadline is not None):
+            timeouts.append(self._deadline - time.monotonic())
+        return min(timeouts) if len(timeouts) > 0 else None
+
     def __runSolution(self, capability: str, solution: Solution) -> None:
-        solution.status = 'Running'
-        self.__runTasks('pre', capability, solution)
-        self.__runTasks('pre-clean', capability, solution)
-        self.__runTasks('run', capability, solution)
-        self.__runTasks('run-clean', capability, solution)
-        self.__runTasks('post', capability, solution)
-        self.__runTasks('post-clean', capability, solution)
+        started = RunRecorder.now()
+        solution.status = TaskStatus.RUNNING
+        self.__runTasks('pre', capability, solution, solution.name)
+        self.__runTasks('pre-clean', capability, solution, solution.name)
+        self.__runTasks('run', capability, solution, solution.name)
+        self.__runTasks('run-clean', capability, solution, solution.name)
+        self.__runTasks('post', capability, solution, solution.name)
+        self.__runTasks('post-clean', capability, solution, solution.name)
+        if(solution.status != TaskStatus.FAILED):
+            solution.status = TaskStatus.FINISHED
+        self._metrics.record('solution', solution.name, solution.status, self._metrics.elapsed(started), capability, solution.name, id=solution.id)
         
-    def __runPhase(self, capability: str, phase: Phase) -> str:
+    def __runPhase(self, capability: str, name: str, phase: Phase) -> str:
         if(phase is None):
-            return 'Finished'
-        phase.status = 'Running'
-        self.__runTasks('pre', capability, phase)
-        self.__runTasks('pre-clean', capability, phase)
-        self.__runTasks('run', capability, phase)
-        self.__runTasks('run-clean', capability, phase)
-        self.__runTasks('post', capability, phase)
-        self.__runTasks('post-clean', capability, phase)
+            return TaskStatus.FINISHED
+        started = RunRecorder.now()
+        phase.status = TaskStatus.RUNNING
+        self.__runTasks('pre', capability, phase, name)
+        self.__runTasks('pre-clean', capability, phase, name)
+        self.__runTasks('run', capability, phase, name)
+        self.__runTasks('run-clean', capability, phase, name)
+        self.__runTasks('post', capability, phase, name)
+        self.__runTasks('post-clean', capability, phase, name)
+        if(phase.status != TaskStatus.FAILED):
+            phase.status = TaskStatus.FINISHED
+        self._metrics.record('phase', name, phase.status, self._metrics.elapsed(started), capability, name, id=phase.id)
         return phase.status
      
     def __runpre(self) -> str:
-        status = 'Finished'
+        status = TaskStatus.FINISHED
         if(self._preTasks is None):
             return status
         self._logger.info(f'🦾 Running pre tasks')
-        status = self.__runPhase("global", self._preTasks)  
-        if(status == 'Failed'):
+        status = self.__runPhase("global", "pre", self._preTasks)  
+        if(status == TaskStatus.FAILED):
             self._logger.error(f'Pre tasks failed')
         return status 
     
     def __runpost(self) -> str:
-        status = 'Finished'
+        status = TaskStatus.FINISHED
         if(self._postTasks is None):
             return status
         self._logger.info(f'🦾 Running post tasks')
-        status = self.__runPhase("global", self._postTasks)  
-        if(status == 'Failed'):
+        status = self.__runPhase("global", "post", self._postTasks)  
+        if(status == TaskStatus.FAILED):
             self._logger.error(f'Post tasks failed')
         return status 
      
+    def runSolution(self, capability: str, solution: Solution, timeout: float = None) -> str:
+        """Run a single solution of a capability (used by `lem worker`)"""
+        self._bagOfVariables.set("capability", f"{capability}")
+        self._deadline = time.monotonic() + float(timeout) if timeout is not None else None
+        try:
+            self.__runSolution(capability, solution)
+        finally:
+            self._deadline = None
+        return solution.status
+
     def __runCapabilities(self) -> str:
-        status = 'Finished'
+        status = TaskStatus.FINISHED
         capabilities = self._capabilities.order
         if(self._steps.isCleanSteps):
             capabilities.reverse()
             
         for capability in capabilities:
+            started = RunRecorder.now()
             status = self.__runCapability(capability, self._capabilities.capability[capability])  
-            if(status == 'Failed'):
+            if(self._capabilities.capability[capability] is not None):
+                self._metrics.record('capability', capability, status, self._metrics.elapsed(started), capability)
+            if(status == TaskStatus.FAILED):
                 self._logger.error(f'Capability: {capability} failed')
                 break 
         return status
      
+    def __isCapabilityEnabled(self, current: str) -> bool:
+        isEnable = self._bagOfVariables.get(f"{current}_enable") or self._bagOfVariables.get(f"{current}.enable")
+        return isEnable.value == True
+
+    def __isSolutionSelected(self, current: str, solution: Solution) -> bool:
+        return self._bagOfVariables.get(f"{current}_solution").value == solution.name or self._bagOfVariables.get(f"{current}.solution").value == solution.name
+
+    def __isInShard(self, current: str, solution: Solution) -> bool:
+        if(self._sharding is None):
+            return True
+        if(self._sharding.assignment is None):
+            # dealt once the pre tasks, which may enable capabilities, are done
+            selected = []
+            for capability in self._capabilities.order:
+                solutions = self._capabilities.capability[capability]
+                if(solutions is not None and self.__isCapabilityEnabled(capability)):
+                    selected.extend([(capability, item) for item in solutions if self.__isSolutionSelected(capability, item)])
+            assignment = self._sharding.assign(selected)
+            self._logger.info(f'🧩 Shard {self._sharding}: {sum(1 for shard in assignment.values() if shard == self._sharding.index)} of {len(assignment)} units')
+        if(self._sharding.owns(current, solution)):
+            return True
+        self._logger.info(f' |->🧩 Skipping solution: {solution.name} of capability: {current} (other shard)')
+        return False
+
     def __runCapability(self, current: str, capability: Optional[List[Solution]]) -> str:
-        status = 'Finished'
+        status = TaskStatus.FINISHED
         self._logger.info(f'🦾 Running capability: {current}')
         self._bagOfVariables.set("capability", f"{current}")
         if(not capability is None): 
-            isEnable = self._bagOfVariables.get(f"{current}_enable") or self._bagOfVariables.get(f"{current}.enable")
-            if(isEnable.value == True):
+            if(self.__isCapabilityEnabled(current)):
+                timeout = self._capabilities.timeout.get(current)
+                self._deadline = time.monotonic() + float(timeout) if timeout is not None else None
                 for solution in capability:
-                    if(self._bagOfVariables.get(f"{current}_solution").value == solution.name or self._bagOfVariables.get(f"{current}.solution").value == solution.name):
+                    if(self.__isSolutionSelected(current, solution) and self.__isInShard(current, solution)):
                         self._logger.info(f' |->💡 Running solution: {solution.name}')
                         self.__runSolution(current, solution)
                     else:
                         self._logger.debug(f'    Skipping solution: {solution.name}')
-                    if(solution.status == 'Failed'):
-                        status = 'Failed'
+                    if(solution.status == TaskStatus.FAILED):
+                        status = TaskStatus.FAILED
                         break
+                self._deadline = None
         else:
             self._logger.debug(f'Skipping capability: {current}')
         return status
 
+    def __planTasks(self, capability: str, solution: Solution, solutionName: str) -> List[dict]:
+        planned = []
+        for step in self.__STEPS:
+            if(not self._steps.get(step, capability)):
+                continue
+            for task in solution.tasks_byStep(step):
+                if(task.condition is not None):
+                    try:
+                        if(self.__evalTaskCondition(capability, task.condition) != True):
+                            continue
+                    except NameNotDefined:
+                        # the condition depends on variables produced at run time, keep the task
+                        pass
+                    except (InvalidExpression, SyntaxError, TypeError, ValueError) as e:
+                        self._logger.error(f'Unable to evaluate the condition of task: {task.displayName} ({task.condition}) - {e}')
+                planned.append({ 'capability': capability, 'solution': solutionName, 'step': step, 'task': task })
+        return planned
+
+    def plan(self) -> List[dict]:
+        """Return the tasks the engine would run, in order, without invoking any plugin"""
+        planned = []
+        if(self._preTasks is not None):
+            planned.extend(self.__planTasks('global', self._preTasks, 'pre'))
+        capabilities = list(self._capabilities.order)
+        if(self._steps.isCleanSteps):
+            capabilities.reverse()
+        for current in capabilities:
+            capability = self._capabilities.capability[current]
+            if(capability is None or not self.__isCapabilityEnabled(current)):
+                continue
+            self._bagOfVariables.set("capability", f"{current}")
+            for solution in capability:
+                if(self.__isSolutionSelected(current, solution) and self.__isInShard(current, solution)):
+                    planned.extend(self.__planTasks(current, solution, solution.name))
+        if(self._postTasks is not None):
+            planned.extend(self.__planTasks('global', self._postTasks, 'post'))
+        if("capability" in self._bagOfVariables._variables):
+            self._bagOfVariables.remove("capability")
+        return planned
+
+    @property
+    def predecessors(self) -> dict:
+        return self._capabilities.predecessors(self._steps.isCleanSteps)
+
+    @property
+    def manifest(self) -> str:
+        return self._metrics.manifest
+
+    def __runSolutionOnWorker(self, address: str, capability: str, solution: Solution, variables: dict, clients: list, cancelled: threading.Event) -> dict:
+        client = WorkerClient(address, cafile=self._workerCa)
+        clients.append(client)
+        try:
+            request = {
+                'type': 'run',
+                'capability': capability,
+                'solution': solution.to_dict(),
+                'steps': self._steps.raw,
+                'requirements': self.plugins.requirements,
+                'variables': encode_variables(variables),
+                'index': encode_index(self._bagOfVariables.get_pending_slice(capability, list(self._capabilities.order))),
+                'timeout': self._capabilities.timeout.get(capability),
+                'manifest': self._metrics.manifest
+            }
+            with client:
+                if(cancelled.is_set()):
+                    raise ConnectionAbortedError('Run cancelled')
+                return client.request(request)
+        except (OSError, TypeError, ValueError) as e:
+            # a variable which can not be encoded fails the solution, not the coordinator
+            if(cancelled.is_set()):
+                self._logger.warning(f'Solution: {solution.name} cancelled on worker: {address}')
+            else:
+                self._logger.error(f'Worker {address} failed to run solution: {solution.name} - {e}')
+            return { 'status': 'Failed', 'tasks': [], 'variables': {} }
+        finally:
+            clients.remove(client)
+
+    def __runCapabilitiesOnWorkers(self) -> str:
+        """Dispatch the selected solutions to the workers; a capability waits for its predecessors (see
+        `Capabilities.predecessors`), so the outputs are the same as those of a local run"""
+        if(worker_token() is None):
+            self._logger.error('No worker token: set $LEM_WORKER_TOKEN to the token of the workers')
+            return TaskStatus.FAILED
+        workers = [address for address in self._workers if WorkerClient(address, cafile=self._workerCa).ping()]
+        if(len(workers) == 0):
+            self._logger.error(f'No worker available in: {self._workers}')
+            return TaskStatus.FAILED
+        self._logger.info(f'🦾 {len(workers)} workers registered: {workers}')
+        available = queue.Queue()
+        for address in workers:
+            available.put(address)
+
+        capabilities = list(self._capabilities.order)
+        if(self._steps.isCleanSteps):
+            capabilities.reverse()
+        predecessors = self.predecessors
+        pending = {}
+        for current in capabilities:
+            solutions = self._capabilities.capability[current]
+            if(solutions is None or not self.__isCapabilityEnabled(current)):
+                self._logger.debug(f'Skipping capability: {current}')
+                continue
+            selected = [solution for solution in solutions if self.__isSolutionSelected(current, solution) and self.__isInShard(current, solution)]
+            pending[current] = selected
+        done = [capability for capability in capabilities if capability not in pending]
+
+        clients = []
+        cancelled = threading.Event()
+        def dispatch(current: str, solution: Solution, variables: dict) -> dict:
+            address = available.get()
+            try:
+                self._logger.info(f' |->💡 Running solution: {solution.name} of capability: {current} on worker: {address}')
+                return self.__runSolutionOnWorker(address, current, solution, variables, clients, cancelled)
+            finally:
+                available.put(address)
+
+        status = TaskStatus.FINISHED
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            while(len(pending) > 0 or len(running) > 0):
+                if(status != TaskStatus.FAILED):
+                    for current in [capability for capability in pending if all(predecessor in done for predecessor in predecessors[capability])]:
+                        for solution in pending.pop(current):
+                            variables = self._bagOfVariables.get_slice(current, capabilities)
+                            variables['capability'] = VariableValue(current)
+                            running[executor.submit(dispatch, current, solution, variables)] = (current, solution, RunRecorder.now())
+                        if(not any(item[0] == current for item in running.values())):
+                            done.append(current)
+                if(len(running) == 0):
+                    break
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    current, solution, started = running.pop(future)
+                    response = future.result()
+                    for task, taskStatus in zip(solution.tasks, response['tasks']):
+                        task.status = TaskStatus(taskStatus)
+                    solution.status = TaskStatus(response['status'])
+                    self._bagOfVariables.append(decode_variables(response['variables']))
+                    self._bagOfVariables.interpret()
+                    self.__streamOutput()
+                    self._metrics.record('solution', solution.name, solution.status, self._metrics.elapsed(started), current, solution.name, id=solution.id)
+                    if(solution.status == TaskStatus.FAILED and not cancelled.is_set()):
+                        self._logger.error(f'Capability: {current} failed after {self._metrics.elapsed(started):.2f}s')
+                        status = TaskStatus.FAILED
+                        # fail fast: no new solution is dispatched and the running ones are cancelled,
+                        # their workers interrupt the task in progress once the connection is closed
+                        pending.clear()
+                        cancelled.set()
+                        for client in list(clients):
+                            client.abort()
+                    elif(not any(item[0] == current for item in running.values())):
+                        done.append(current)
+        return status
+
+    def __streamOutput(self) -> None:
+        if(self._output is not None):
+            self._output.append(self._bagOfVariables.changes())
+
     def start(self) -> str:
-        self.__reload_plugins()
+        if(self._outputContextPath is not None):
+            self._output = OutputContextWriter(self._logger, self._outputContextPath)
+            self._bagOfVariables.track_changes()
+        try:
+            return self.__start()
+        finally:
+            if(self._output is not None):
+                self._output.close()
+            self.close()
+
+    def close(self) -> None:
+        """Release the variable and metrics stores, for an engine not run with `start` (e.g. an estimate or
+        a solution run by a worker)"""
+        self._bagOfVariables.close()
+        self._metrics.close()
+
+    def __start(self) -> str:
+        if(self._capabilities is None):
+            self._logger.error('No capability to run: the manifest could not be loaded')
+            return TaskStatus.FAILED
+        if(self._reloadPlugins):
+            self.__reload_plugins()
         status = self.__runpre()
-        if(status == 'Failed'):
+        if(status == TaskStatus.FAILED):
             return status
-        status = self.__runCapabilities()
-        if(status == 'Failed'):
+        if(len(self._workers) > 0):
+            status = self.__runCapabilitiesOnWorkers()
+        else:
+            status = self.__runCapabilities()
+        if(status == TaskStatus.FAILED):
             return status
         status = self.__runpost()
   
-        if(self._outputContextPath is not None):
+        if(self._output is not None):
             self._logger.info(f"Saving output context...")
-            self._bagOfVariables.remove("capability")
-            self._bagOfVariables.save(self._outputContextPath)
-            self._logger.info(f"Output context saved to: {self._outputContextPath}")
+            if("capability" in self._bagOfVariables._variables):
+                self._bagOfVariables.remove("capability")
+            count = self._output.compact(self._bagOfVariables._variables.to_save())
+            self._logger.info(f"Output context saved to: {self._outputContextPath} ({count} variables)")
         return status
 
     def __reload_plugins(self) -> None:
@@ -174,14 +473,20 @@ class OrchestratorEngine:
         provided plugin package to load all available plugins
         """
         self.plugins.discover_plugins(True)
+        for name, status, duration in self.plugins.timings:
+            self._metrics.record('plugin', name, status, duration)
 
-    def __invoke_on_plugin(self, moduleName: str, parameters: dict = None, variables: dict = None) -> TaskResult:
+    def __invoke_on_plugin(self, moduleName: str, parameters: dict = None, variables: dict = None, timeout: float = None) -> TaskResult:
         plugin = self.plugins.register_plugin_by_alias(moduleName)
         if(plugin is None):
-            self._logger.error(f'       Failed to load plugin: {moduleName} - Skip task')
-            return
+            self._logger.error(f'       Failed to load plugin: {moduleName}')
+            return TaskResult(moduleName, 'Failed', [f'No plugin found for alias: {moduleName}'])
         delegate = self.plugins.hook_invoke(plugin)
-        task = delegate(parameters=parameters, variables=variables)
+        try:
+            task = self._watchdog.run(moduleName, timeout, delegate, parameters=parameters, variables=variables)
+        except TaskInterrupted as e:
+            self._logger.error(f'       Interrupted task: {moduleName} - {e.reason}')
+            return TaskResult(moduleName, 'Failed', [e.reason])
         if(task.status == 'Failed'):
             self._logger.error(f'       Failed task: {task.name} with errors: {task.errors}')
         else:
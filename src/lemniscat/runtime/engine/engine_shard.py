@@ -0,0 +1,73 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+from lemniscat.runtime.model.models import Solution
+
+def parse_shard(option: str) -> Tuple[int, int]:
+    """Parse the --shard option `<index>/<count>`, the index starting at 1"""
+    try:
+        index, count = [int(part) for part in option.split('/')]
+    except ValueError:
+        raise ValueError(f'Invalid shard: {option}, expected <index>/<count> (e.g. 1/3)')
+    if(count < 1 or index < 1 or index > count):
+        raise ValueError(f'Invalid shard: {option}, the index must be between 1 and {count}')
+    return (index, count)
+
+def groups(dependsOn: Dict[str, List[str]]) -> Dict[str, str]:
+    """Return, for each capability linked to another by a `dependsOn`, the first capability (by name) of the group
+    it belongs to; a capability without any `dependsOn` link is in no group"""
+    root = {}
+    def find(capability: str) -> str:
+        root.setdefault(capability, capability)
+        while(root[capability] != capability):
+            capability = root[capability]
+        return capability
+    for capability, dependencies in dependsOn.items():
+        for dependency in dependencies:
+            first, second = sorted([find(capability), find(dependency)])
+            root[second] = first
+    return { capability: find(capability) for capability in root }
+
+class Sharding:
+    """Deterministic partition of the selected solutions of a run across CI agents. Each solution is a unit, except
+    for the capabilities linked by a `dependsOn` (see `groups`), which stay together on one shard as they share
+    variables: a capability reading the outputs of another one must declare it in its `dependsOn` to be sharded.
+    The units are ordered by a hash of their stable ids and dealt in turn, so every agent computes the same
+    partition without talking to the others"""
+    index: int
+    count: int
+    _groups: Dict[str, str]
+    assignment: Dict[str, int]
+
+    def __init__(self, index: int, count: int, dependsOn: Dict[str, List[str]]) -> None:
+        self.index = index
+        self.count = count
+        self._groups = groups(dependsOn)
+        self.assignment = None
+
+    @classmethod
+    def from_option(cls, option: str, dependsOn: Dict[str, List[str]]) -> Optional['Sharding']:
+        if(option is None):
+            return None
+        index, count = parse_shard(option)
+        return cls(index, count, dependsOn)
+
+    def unit(self, capability: str, solution: Solution) -> str:
+        if(capability in self._groups):
+            return '+'.join(sorted(item for item in self._groups if self._groups[item] == self._groups[capability]))
+        return solution.id
+
+    @staticmethod
+    def __hash(unit: str) -> str:
+        return hashlib.sha256(unit.encode('utf-8')).hexdigest()
+
+    def assign(self, selected: List[Tuple[str, Solution]]) -> Dict[str, int]:
+        """Deal the units of the selected solutions (capability, solution) to the shards, numbered from 1"""
+        units = sorted(set(self.unit(capability, solution) for capability, solution in selected), key=self.__hash)
+        self.assignment = { unit: position % self.count + 1 for position, unit in enumerate(units) }
+        return self.assignment
+
+    def owns(self, capability: str, solution: Solution) -> bool:
+        return self.assignment.get(self.unit(capability, solution)) == self.index
+
+    def __str__(self) -> str:
+        return f'{self.index}/{self.count}'
@@ -0,0 +1,526 @@
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from typing import Iterator, List, Tuple
+import json
+import os
+import pickle
+import re
+import sqlite3
+import tempfile
+import weakref
+from lemniscat.core.model.models import VariableValue
+from lemniscat.core.util.helpers import Interpreter
+from .engine_template import CompiledTemplate
+
+_REGEX_CAPABILITY_VARIABLE = r"^(?P<capability>\w+)\.(?P<variable>.*)"
+_MARKER = '${{'.encode('utf-8')
+# stored in the header of the databases created by `SqliteVariableStore`: only those are ever overwritten
+_APPLICATION_ID = 0x4C454D56
+
+def split_capability(key: str) -> Tuple[str, str]:
+    """Return the capability and the variable of a key scoped to a capability (`<capability>.<variable>`)"""
+    if(not '.' in str(key)):
+        return (None, None)
+    m = re.match(_REGEX_CAPABILITY_VARIABLE, str(key))
+    if(m is None):
+        return (None, None)
+    return (m.group('capability'), m.group('variable'))
+
+def _check_owner(connection: sqlite3.Connection, path: str) -> None:
+    # a database holding anything but the variables of a previous run is never overwritten
+    try:
+        tables = connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]
+        owner = connection.execute('PRAGMA application_id').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f'Unable to use {path} as variable store: {e}')
+    if(tables > 0 and owner != _APPLICATION_ID):
+        raise ValueError(f'Unable to use {path} as variable store: the database is not empty and was not created by lemniscat')
+
+def variable_value(value, sensitive: bool) -> VariableValue:
+    # VariableValue() would unwrap a dict value holding 'value' and 'sensitive' keys
+    variable = VariableValue.__new__(VariableValue)
+    variable.value = value
+    variable.sensitive = sensitive
+    return variable
+
+class StoredValue:
+    """A variable of a binary context (see `BinaryContext`), already interpreted: decoded the first time
+    it is accessed and never rendered again"""
+    __slots__ = ('context', 'position')
+
+    def __init__(self, context, position: int) -> None:
+        self.context = context
+        self.position = position
+
+    def decode(self) -> VariableValue:
+        return self.context.variable(self.position)
+
+class VariableStore(ABC):
+    """The storage backend of a `BagOfVariables`: a mapping of `VariableValue` by key, where the raw values of
+    the config files are only indexed and interpreted the first time they are accessed"""
+
+    @staticmethod
+    def create(option: str = None) -> 'VariableStore':
+        """Build the store from the --variableStore option: `memory` (default), `sqlite` or `sqlite:<path>`"""
+        if(option is None or option == 'memory'):
+            return LazyVariables()
+        if(option == 'sqlite'):
+            return SqliteVariableStore()
+        if(option.startswith('sqlite:')):
+            return SqliteVariableStore(option[len('sqlite:'):])
+        raise ValueError(f'Unknown variable store: {option}')
+
+    @staticmethod
+    def check(option: str = None) -> None:
+        """Raise a ValueError when the --variableStore option is unknown or names a database that may not be used"""
+        if(option is None or option in ['memory', 'sqlite']):
+            return
+        if(not option.startswith('sqlite:')):
+            raise ValueError(f'Unknown variable store: {option}')
+        path = option[len('sqlite:'):]
+        if(os.path.exists(path)):
+            connection = sqlite3.connect(path)
+            try:
+                _check_owner(connection, path)
+            finally:
+                connection.close()
+
+    @abstractmethod
+    def index(self, key: str, value) -> None:
+        """Register the raw value of a key without creating the variable"""
+
+    @abstractmethod
+    def stored(self, key: str, value: StoredValue) -> None:
+        """Register a variable of a binary context without decoding it"""
+
+    @abstractmethod
+    def raw(self, key: str) -> object:
+        """Return the raw value of an indexed key"""
+
+    @abstractmethod
+    def pending(self) -> List[str]:
+        """Return the indexed keys that have not been materialized yet"""
+
+    @abstractmethod
+    def is_pending(self, key: str) -> bool:
+        """Return whether a key is indexed and not materialized yet"""
+
+    @abstractmethod
+    def peek(self, key: str, variables: MutableMapping = None) -> VariableValue:
+        """Return a variable without materializing it, its references being read from `variables` (the store itself by default)"""
+
+    @abstractmethod
+    def scoped(self, capability: str) -> dict:
+        """Return the keys scoped to a capability (`<capability>.<variable>`) by variable"""
+
+    @abstractmethod
+    def slice(self, excluded: List[str], pending: bool = False) -> dict:
+        """Return the variables, or the raw values of the pending keys, without those scoped to the excluded
+        capabilities; the variables of a binary context are decoded, never returned as raw values"""
+
+    def for_capability(self, capability: str) -> MutableMapping:
+        """Return the variables given to a task of a capability, `<capability>.<variable>` keys being also
+        available as `<variable>`"""
+        return CapabilityView(self, capability)
+
+    @abstractmethod
+    def interpret(self, interpreter: Interpreter, excludeInterpret: list = []) -> None:
+        pass
+
+    def to_save(self) -> Iterator[Tuple[str, VariableValue]]:
+        """Iterate over every variable, materialized or not"""
+        for key in self.pending():
+            yield (key, self.peek(key))
+        for key in self:
+            yield (key, self[key])
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class LazyVariables(dict, VariableStore):
+    """The in-memory store: materialized variables are the items of the dict itself. Iterating it only
+    yields the materialized variables: plugins are given a `CapabilityView`, which also yields the pending ones"""
+    _index: dict
+    _scoped: dict
+    _hidden: set
+    _resolving: set
+    _decoded: set
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._index = {}
+        self._scoped = {}
+        self._hidden = set()
+        self._resolving = set()
+        self._decoded = set()
+
+    def index(self, key: str, value) -> None:
+        self._index[key] = value
+        self._hidden.discard(key)
+        self._decoded.discard(key)
+        capability, variable = split_capability(key)
+        if(not capability is None):
+            self._scoped.setdefault(capability, {})[variable] = key
+
+    def stored(self, key: str, value: StoredValue) -> None:
+        # indexed like a raw value, but decoded instead of rendered
+        self.index(key, value)
+
+    def __isIndexed(self, key) -> bool:
+        return key in self._index and not key in self._hidden and not key in self._resolving
+
+    def __render(self, key: str, variables: MutableMapping = None) -> VariableValue:
+        if(isinstance(self._index[key], StoredValue)):
+            return self._index[key].decode()
+        self._resolving.add(key)
+        try:
+            variable = VariableValue(self._index[key])
+            rendered = CompiledTemplate(variable.value).render(self if variables is None else variables)
+        finally:
+            self._resolving.discard(key)
+        return VariableValue(rendered.value, variable.sensitive or rendered.sensitive)
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or self.__isIndexed(key)
+
+    def __getitem__(self, key) -> VariableValue:
+        if(dict.__contains__(self, key)):
+            return dict.__getitem__(self, key)
+        if(not self.__isIndexed(key)):
+            raise KeyError(key)
+        variable = self.__render(key)
+        dict.__setitem__(self, key, variable)
+        if(isinstance(self._index[key], StoredValue)):
+            self._decoded.add(key)
+        return variable
+
+    def __setitem__(self, key, value) -> None:
+        dict.__setitem__(self, key, value)
+        self._hidden.discard(key)
+        self._decoded.discard(key)
+        capability, variable = split_capability(key)
+        if(not capability is None):
+            self._scoped.setdefault(capability, {})[variable] = key
+
+    def __delitem__(self, key) -> None:
+        found = False
+        if(dict.__contains__(self, key)):
+            dict.__delitem__(self, key)
+            self._decoded.discard(key)
+            found = True
+        if(self.__isIndexed(key)):
+            self._hidden.add(key)
+            found = True
+        if(not found):
+            raise KeyError(key)
+
+    def __iter__(self):
+        # accessing a key while iterating (e.g. during interpretation) may materialize a new one
+        return iter(list(dict.keys(self)))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def update(self, variables=(), **kwargs) -> None:
+        if(isinstance(variables, CapabilityView) and variables.store is self):
+            # only the variables added or modified by the task
+            variables = variables.overlay
+        for key, value in dict(variables, **kwargs).items():
+            self[key] = value
+
+    def raw(self, key: str) -> object:
+        return self._index[key]
+
+    def pending(self) -> List[str]:
+        return [key for key in self._index if not dict.__contains__(self, key) and not key in self._hidden]
+
+    def is_pending(self, key: str) -> bool:
+        return not dict.__contains__(self, key) and self.__isIndexed(key)
+
+    def peek(self, key: str, variables: MutableMapping = None) -> VariableValue:
+        if(dict.__contains__(self, key)):
+            return dict.__getitem__(self, key)
+        return self.__render(key, variables)
+
+    def scoped(self, capability: str) -> dict:
+        return { variable: key for variable, key in self._scoped.get(capability, {}).items() if key in self }
+
+    def slice(self, excluded: List[str], pending: bool = False) -> dict:
+        others = tuple(f'{capability}.' for capability in excluded)
+        result = {}
+        if(not pending):
+            result = { key: variable for key, variable in dict.items(self) if not str(key).startswith(others) }
+        for key in self.pending():
+            if(str(key).startswith(others)):
+                continue
+            raw = self._index[key]
+            if(pending and not isinstance(raw, StoredValue)):
+                result[key] = raw
+            elif(not pending and isinstance(raw, StoredValue)):
+                result[key] = raw.decode()
+        return result
+
+    def interpret(self, interpreter: Interpreter, excludeInterpret: list = []) -> None:
+        if(len(self._decoded) == 0):
+            interpreter.interpret(excludeInterpret)
+            return
+        # the variables of a binary context are already interpreted: they are never rendered again
+        Interpreter(interpreter._logger, _Interpretable(self)).interpret(excludeInterpret)
+
+class _Interpretable(MutableMapping):
+    """The variables of a `LazyVariables` an interpreter goes through: all of them but those decoded from a
+    binary context, which it may still read"""
+
+    def __init__(self, store: LazyVariables) -> None:
+        self.store = store
+
+    def __getitem__(self, key) -> VariableValue:
+        return self.store[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.store
+
+    def __setitem__(self, key, value: VariableValue) -> None:
+        self.store[key] = value
+
+    def __delitem__(self, key) -> None:
+        del self.store[key]
+
+    def __iter__(self):
+        return iter([key for key in self.store if not key in self.store._decoded])
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+class SqliteVariableStore(VariableStore, MutableMapping):
+    """A store keeping the variables in an SQLite database instead of memory, for very large bags.
+    Writes are committed in batches; keys are indexed for prefix and capability queries. A database given by
+    path must be new, empty or created by a previous run: any other database is refused, never overwritten."""
+    path: str
+
+    def __init__(self, path: str = None, batchSize: int = 1000) -> None:
+        temporary = path is None
+        if(temporary):
+            descriptor, path = tempfile.mkstemp(prefix='lemniscat-', suffix='.db')
+            os.close(descriptor)
+        self.path = path
+        self._batchSize = batchSize
+        self._writes = 0
+        self._resolving = set()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if(not temporary):
+            try:
+                _check_owner(self._connection, path)
+            except ValueError:
+                self._connection.close()
+                raise
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._connection.execute('PRAGMA journal_mode = MEMORY')
+        self._connection.execute(f'PRAGMA application_id = {_APPLICATION_ID}')
+        self._connection.execute('DROP TABLE IF EXISTS variables')
+        # state: 0 for a raw value indexed from a config file, 1 for a materialized variable,
+        # 2 for a variable of a binary context, kept as JSON until it is accessed
+        self._connection.execute('CREATE TABLE variables (key TEXT PRIMARY KEY, capability TEXT, name TEXT, value BLOB, sensitive INTEGER NOT NULL, state INTEGER NOT NULL, unresolved INTEGER NOT NULL)')
+        self._connection.execute('CREATE INDEX variables_capability ON variables (capability, name)')
+        self._connection.commit()
+        self._finalizer = weakref.finalize(self, SqliteVariableStore.__cleanup, self._connection, path if temporary else None)
+
+    @staticmethod
+    def __cleanup(connection: sqlite3.Connection, temporaryPath: str) -> None:
+        connection.commit()
+        connection.close()
+        if(temporaryPath is not None and os.path.exists(temporaryPath)):
+            os.remove(temporaryPath)
+
+    def __write(self, key: str, value, sensitive: bool, state: int) -> None:
+        capability, variable = split_capability(key)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO variables (key, capability, name, value, sensitive, state, unresolved) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, capability, variable, blob, 1 if sensitive else 0, state, 1 if _MARKER in blob else 0))
+        self._writes += 1
+        if(self._writes >= self._batchSize):
+            self.commit()
+
+    def __row(self, key: str) -> tuple:
+        return self._connection.execute('SELECT value, sensitive, state FROM variables WHERE key = ?', (key,)).fetchone()
+
+    def __render(self, key: str, blob: bytes, variables: MutableMapping = None) -> VariableValue:
+        self._resolving.add(key)
+        try:
+            variable = VariableValue(pickle.loads(blob))
+            rendered = CompiledTemplate(variable.value).render(self if variables is None else variables)
+        finally:
+            self._resolving.discard(key)
+        return VariableValue(rendered.value, variable.sensitive or rendered.sensitive)
+
+    @staticmethod
+    def __decode(row: tuple) -> VariableValue:
+        if(row[2] == 2):
+            return variable_value(json.loads(row[0]), bool(row[1]))
+        return variable_value(pickle.loads(row[0]), bool(row[1]))
+
+    def __contains__(self, key) -> bool:
+        row = self._connection.execute('SELECT state FROM variables WHERE key = ?', (key,)).fetchone()
+        return row is not None and (row[0] != 0 or not key in self._resolving)
+
+    def __getitem__(self, key) -> VariableValue:
+        row = self.__row(key)
+        if(row is None or (row[2] == 0 and key in self._resolving)):
+            raise KeyError(key)
+        if(row[2] != 0):
+            return self.__decode(row)
+        variable = self.__render(key, row[0])
+        self.__write(key, variable.value, variable.sensitive, 1)
+        return variable
+
+    def __setitem__(self, key, value: VariableValue) -> None:
+        self.__write(key, value.value, value.sensitive, 1)
+
+    def __delitem__(self, key) -> None:
+        if(self._connection.execute('DELETE FROM variables WHERE key = ?', (key,)).rowcount == 0):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter([row[0] for row in self._connection.execute('SELECT key FROM variables WHERE state != 0')])
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM variables WHERE state != 0').fetchone()[0]
+
+    def update(self, variables=(), **kwargs) -> None:
+        if(isinstance(variables, CapabilityView) and variables.store is self):
+            # only the variables added or modified by the task
+            variables = variables.overlay
+        MutableMapping.update(self, variables, **kwargs)
+
+    def scoped(self, capability: str) -> dict:
+        """Return the keys scoped to a capability by variable, using the capability index"""
+        return { row[0]: row[1] for row in self._connection.execute('SELECT name, key FROM variables WHERE capability = ?', (capability,)) }
+
+    def slice(self, excluded: List[str], pending: bool = False) -> dict:
+        """Read the slice in one query on the capability column: the rows of the excluded capabilities are never decoded"""
+        scope = f"(capability IS NULL OR capability NOT IN ({', '.join('?' * len(excluded))}))"
+        if(pending):
+            rows = self._connection.execute(f'SELECT key, value FROM variables WHERE state = 0 AND {scope}', list(excluded))
+            return { key: pickle.loads(value) for key, value in rows }
+        rows = self._connection.execute(f'SELECT key, value, sensitive, state FROM variables WHERE state != 0 AND {scope}', list(excluded))
+        return { row[0]: self.__decode(row[1:]) for row in rows }
+
+    def index(self, key: str, value) -> None:
+        self.__write(key, value, False, 0)
+
+    def stored(self, key: str, value: StoredValue) -> None:
+        # the JSON is copied from the mapped file as is
+        encoded, sensitive = value.context.encoded(value.position)
+        capability, variable = split_capability(key)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO variables (key, capability, name, value, sensitive, state, unresolved) VALUES (?, ?, ?, ?, ?, ?, 0)',
+            (key, capability, variable, bytes(encoded), 1 if sensitive else 0, 2))
+        self._writes += 1
+        if(self._writes >= self._batchSize):
+            self.commit()
+
+    def raw(self, key: str) -> object:
+        return pickle.loads(self.__row(key)[0])
+
+    def pending(self) -> List[str]:
+        return [row[0] for row in self._connection.execute('SELECT key FROM variables WHERE state = 0')]
+
+    def is_pending(self, key: str) -> bool:
+        row = self._connection.execute('SELECT state FROM variables WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] == 0 and not key in self._resolving
+
+    def peek(self, key: str, variables: MutableMapping = None) -> VariableValue:
+        row = self.__row(key)
+        if(row[2] != 0):
+            return self.__decode(row)
+        return self.__render(key, row[0], variables)
+
+    def interpret(self, interpreter: Interpreter, excludeInterpret: list = []) -> None:
+        # only the variables still holding an expression may change
+        keys = [row[0] for row in self._connection.execute('SELECT key FROM variables WHERE state = 1 AND unresolved = 1')]
+        for key in keys:
+            variable = self[key]
+            rendered = CompiledTemplate(variable.value, excludeInterpret).render(self)
+            if(rendered.value != variable.value or rendered.sensitive and not variable.sensitive):
+                self.__write(key, rendered.value, variable.sensitive or rendered.sensitive, 1)
+
+    def commit(self) -> None:
+        self._connection.commit()
+        self._writes = 0
+
+    def close(self) -> None:
+        self._finalizer()
+
+class CapabilityView(MutableMapping):
+    """The variables of a store given to a task: reads go to the store, a pending variable being rendered for the
+    task only, so that the store stays as lazy as it was; writes are kept in an overlay when they change a value,
+    so tasks never copy the whole bag. Iterating it yields every variable, pending ones included, as a plugin may
+    read any of them"""
+    store: VariableStore
+    capability: str
+    overlay: dict
+
+    def __init__(self, store: VariableStore, capability: str) -> None:
+        self.store = store
+        self.capability = capability
+        self.overlay = {}
+        self._removed = set()
+        self._rendered = {}
+        self._keys = None
+
+    def __read(self, key: str) -> VariableValue:
+        if(key in self._rendered):
+            return self._rendered[key]
+        if(not self.store.is_pending(key)):
+            return self.store[key]
+        # the references of the variable are read through the view too
+        variable = self.store.peek(key, self)
+        self._rendered[key] = variable
+        return variable
+
+    def __getitem__(self, key) -> VariableValue:
+        if(key in self.overlay):
+            return self.overlay[key]
+        if(key in self._removed):
+            raise KeyError(key)
+        if(key in self.store):
+            return self.__read(key)
+        return self.__read(f'{self.capability}.{key}')
+
+    def __contains__(self, key) -> bool:
+        if(key in self.overlay):
+            return True
+        if(key in self._removed):
+            return False
+        return key in self.store or f'{self.capability}.{key}' in self.store
+
+    def __setitem__(self, key, value: VariableValue) -> None:
+        self._removed.discard(key)
+        if(not key in self.overlay and key in self):
+            current = self[key]
+            if(current.value == value.value and current.sensitive == value.sensitive):
+                return
+        self.overlay[key] = value
+
+    def __delitem__(self, key) -> None:
+        if(not key in self):
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        self._removed.add(key)
+
+    def __iter__(self):
+        if(self._keys is None):
+            # the keys of the store are listed once per task, however many times a plugin iterates the view
+            self._keys = dict.fromkeys(self.store)
+            self._keys.update(dict.fromkeys(self.store.pending()))
+            self._keys.update(dict.fromkeys(self.store.scoped(self.capability)))
+        keys = dict(self._keys)
+        keys.update(dict.fromkeys(self.overlay))
+        return iter([key for key in keys if not key in self._removed])
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
@@ -0,0 +1,130 @@
+from typing import Dict, List, Tuple
+import os
+import re
+from lemniscat.core.model.models import VariableValue
+from lemniscat.core.util.helpers import FileSystem
+
+_REGEX_CAPTURE_VARIABLE = r"(?:\${{(?P<var>[^}]+)}})"
+_REGEX_CAPTURE_VARIABLE_CONVERTSTR = r"(?:\W*str\((?P<var>[^)]+)\)\W*)"
+_MARKER = '${{'
+
+class Reference:
+    """A `${{ variable }}` or `${{ str(variable) }}` expression of a manifest string"""
+    __slots__ = ('name', 'convert', 'expression')
+
+    def __init__(self, name: str, convert: bool, expression: str) -> None:
+        self.name = name
+        self.convert = convert
+        self.expression = expression
+
+class CompiledString:
+    """A manifest string tokenized once into literal segments and variable references"""
+    __slots__ = ('segments',)
+
+    def __init__(self, value: str) -> None:
+        self.segments = []
+        position = 0
+        for match in re.finditer(_REGEX_CAPTURE_VARIABLE, value):
+            if(match.start() > position):
+                self.segments.append(value[position:match.start()])
+            inner = match.group('var')
+            convert = re.findall(_REGEX_CAPTURE_VARIABLE_CONVERTSTR, inner)
+            if(len(convert) > 0):
+                self.segments.append(Reference(convert[0].strip(), True, match.group(0)))
+            else:
+                self.segments.append(Reference(inner.strip(), False, match.group(0)))
+            position = match.end()
+        if(position < len(value)):
+            self.segments.append(value[position:])
+
+    def render(self, variables: dict) -> VariableValue:
+        sensitive = False
+        if(len(self.segments) == 1 and isinstance(self.segments[0], Reference)):
+            # a string made of a single expression keeps the type of the variable
+            reference = self.segments[0]
+            if(not reference.name in variables):
+                return VariableValue(reference.expression)
+            variable = variables[reference.name]
+            return VariableValue(str(variable.value) if reference.convert else variable.value, variable.sensitive)
+        parts = []
+        for segment in self.segments:
+            if(isinstance(segment, str)):
+                parts.append(segment)
+            elif(segment.name in variables):
+                variable = variables[segment.name]
+                sensitive = sensitive or variable.sensitive
+                parts.append(str(variable.value))
+            else:
+                parts.append(segment.expression)
+        return VariableValue(''.join(parts), sensitive)
+
+class CompiledTemplate:
+    """A manifest tree where every string containing expressions is compiled once;
+    rendering it is then a lookup of the referenced variables and a join"""
+    _root: object
+    references: List[str]
+
+    def __init__(self, value, excludeInterpret: list = []) -> None:
+        self.references = []
+        self._root = self.__compile(value, excludeInterpret)
+
+    def __compile(self, value, excludeInterpret: list):
+        if(isinstance(value, str)):
+            if(not _MARKER in value):
+                return value
+            compiled = CompiledString(value)
+            self.references.extend([segment.name for segment in compiled.segments if isinstance(segment, Reference)])
+            return compiled
+        if(isinstance(value, dict)):
+            return { key: (_Raw(item) if key in excludeInterpret else self.__compile(item, excludeInterpret)) for key, item in value.items() }
+        if(isinstance(value, list)):
+            return [self.__compile(item, excludeInterpret) for item in value]
+        return value
+
+    @staticmethod
+    def __render(node, variables: dict, sensitive: List[bool]):
+        if(isinstance(node, CompiledString)):
+            result = node.render(variables)
+            if(result.sensitive):
+                sensitive[0] = True
+            return result.value
+        if(isinstance(node, dict)):
+            return { key: CompiledTemplate.__render(item, variables, sensitive) for key, item in node.items() }
+        if(isinstance(node, list)):
+            return [CompiledTemplate.__render(item, variables, sensitive) for item in node]
+        if(isinstance(node, _Raw)):
+            return _copy(node.value)
+        return node
+
+    def render(self, variables: dict) -> VariableValue:
+        """Return a new tree with the expressions replaced by the value of the variables"""
+        sensitive = [False]
+        value = CompiledTemplate.__render(self._root, variables, sensitive)
+        return VariableValue(value, sensitive[0])
+
+class _Raw:
+    """A value excluded from interpretation"""
+    __slots__ = ('value',)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+def _copy(value):
+    # rendered trees are mutated by the tasks and the plugins, the compiled one must stay intact
+    if(isinstance(value, dict)):
+        return { key: _copy(item) for key, item in value.items() }
+    if(isinstance(value, list)):
+        return [_copy(item) for item in value]
+    return value
+
+_FILES: Dict[str, Tuple[tuple, CompiledTemplate]] = {}
+
+def load_template(path: str, excludeInterpret: list = []) -> CompiledTemplate:
+    """Compile a template file once, until it is modified"""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size, tuple(excludeInterpret))
+    cached = _FILES.get(path)
+    if(cached is None or cached[0] != key):
+        cached = (key, CompiledTemplate(FileSystem.load_configuration_path(path), excludeInterpret))
+        _FILES[path] = cached
+    return cached[1]
@@ -2,35 +2,42 @@ from logging import Logger
 import json
 import ast
 import logging
-import re
 from dacite import ForwardReferenceError, MissingValueError, UnexpectedDataError, WrongTypeError, from_dict
 from lemniscat.core.util.helpers import FileSystem, Interpreter
 from lemniscat.core.model.models import VariableValue
 from lemniscat.runtime.model.models import Variable
+from .engine_template import CompiledTemplate
+from .engine_store import LazyVariables, StoredValue, VariableStore
+from .engine_output import OutputContextReader, has_journal, open_binary_context, save_context
+from .engine_context import is_binary_context
 
 class BagOfVariables:
     """A bag of variables that can be used to store and retrieve variables"""
     _logger: Logger
     _interpeter: Interpreter
-    _variables: dict = {}
+    _variables: VariableStore = {}
+    _changed: dict = None
+    _contexts: list = []
 
     def __loadVariables__(self, key: str, variable) -> None:
         if isinstance(variable, dict):
             if '~object' in variable.keys() and variable['~object'] == True:
                 variable.pop('~object')
-                self._variables[key] = VariableValue(variable)
+                self._variables.index(key, variable)
             else:
                 for subKey in variable:
                     self.__loadVariables__(f'{key}_{subKey}', variable[subKey])
         else:    
-            self._variables[key] = VariableValue(variable)
+            self._variables.index(key, variable)
 
     def __init__(self, logger, *args) -> None:
         self._logger = logger
-        self._variables = {}
+        self._variables = LazyVariables()
+        self._contexts = []
 
         try:
             self._logger.info("Loading variables")
+            self._variables = VariableStore.create(args[0].get('variableStore'))
             conf = args[0]['configFiles']
             try:
                 configFiles = ast.literal_eval(conf)
@@ -41,9 +48,18 @@ class BagOfVariables:
             for file in configFiles:
                 self._logger.debug(f"Loading variables from file: {file}...")
                 try:
+                    if is_binary_context(file):
+                        # already flattened and interpreted: only the keys are read, the values are decoded on first access
+                        if(has_journal(file)):
+                            self._logger.warning(f"The run writing {file} died midway: its journal is replayed")
+                        context = open_binary_context(file)
+                        for position, key in enumerate(context.keys()):
+                            self._variables.stored(key, StoredValue(context, position))
+                        self._contexts.append(context)
+                        self._logger.debug(f"{len(context)} loaded.")
                     if file.endswith('.json'):
-                        with open(file, 'r') as f:
-                            variables = json.load(f)
+                        # an output context of a previous run is read through its index, value by value
+                        variables = OutputContextReader(file).load()
                         for key in variables:
                             self.__loadVariables__(key, variables[key])
                         self._logger.debug(f"{len(variables)} loaded.")
@@ -63,7 +79,7 @@ class BagOfVariables:
             self._logger.debug(f"Loading variables from manifest...")
             try:
                 self.__append_manifestVariables(args[0]['manifest'])
-                self._logger.debug(f"{len(variables)} loaded.")
+                self._logger.debug(f"Manifest variables loaded.")
             except Exception as e:
                 self._logger.error(f"Error loading manifest variables: {e}")
 
@@ -78,12 +94,26 @@ class BagOfVariables:
                 self._logger.error(f"Error parsing extra variables: {e}")
 
             self._interpeter = Interpreter(logger, self._variables)
-            self._interpeter.interpret()
-            self._logger.info("Variables loaded")
+            self.interpret()
+            self._variables.commit()
+            self._logger.info(f"Variables loaded ({len(self._variables)} used, {len(self._variables.pending())} indexed from config files)")
 
         except Exception as e:
             self._logger.error(f"Unexpected error in initialization: {e}")
         
+    @classmethod
+    def from_variables(cls, logger: Logger, variables: dict, index: dict = {}) -> 'BagOfVariables':
+        """Build a bag from already interpreted variables and raw config values (e.g. the slice sent to a worker)"""
+        bag = cls.__new__(cls)
+        bag._logger = logger
+        bag._variables = LazyVariables()
+        bag._contexts = []
+        for key in index:
+            bag._variables.index(key, index[key])
+        bag._variables.update(variables)
+        bag._interpeter = Interpreter(logger, bag._variables)
+        return bag
+
     def __append_manifestVariables(self, manifest_path) -> None:
         try:
             manifest_data = FileSystem.load_configuration_path(manifest_path)
@@ -109,13 +139,7 @@ class BagOfVariables:
         return result  
     
     def get_all_for_capability(self, capability: str) -> dict:
-        result = {}
-        for key in self._variables.keys():
-            m = re.match(r"^(?P<capability>\w+)\.(?P<variable>.*)", str(key))
-            if(not m is None):
-                if(m.group('capability') == capability):
-                    result[m.group('variable')] = self._variables[key]
-        result.update(self._variables)
+        result = self._variables.for_capability(capability)
         
         if(self._logger.level == logging.DEBUG):
             self._logger.debug(f"-----------------------------------------------")
@@ -125,11 +149,41 @@ class BagOfVariables:
             self._logger.debug(f"-----------------------------------------------")
         return result
 
+    def get_slice(self, capability: str, capabilities: list) -> dict:
+        """Return the variables without those scoped to another capability (`<other>.<variable>`); the variables
+        of a binary context are already interpreted: they are sent with their sensitive flag"""
+        return self._variables.slice([other for other in capabilities if other != capability])
+
+    def get_pending_slice(self, capability: str, capabilities: list) -> dict:
+        """Return the raw config values not materialized yet, without those scoped to another capability"""
+        return self._variables.slice([other for other in capabilities if other != capability], pending=True)
+
     def set(self, key: str, value: str, sensitive: bool = False) -> None:
         self._variables[key] = VariableValue(value, sensitive)
         
     def append(self, variables: dict) -> None:
+        if(self._changed is not None):
+            self.__track(variables)
         self._variables.update(variables)
+
+    def __track(self, variables: dict) -> None:
+        # the variables given back by a plugin are all those it received, keep only the modified ones
+        for key, variable in getattr(variables, 'overlay', variables).items():
+            current = self._variables.get(key)
+            if(current is None or current.value != variable.value or current.sensitive != variable.sensitive):
+                self._changed[key] = None
+
+    def track_changes(self) -> None:
+        """Start recording the keys modified by `append`"""
+        self._changed = {}
+
+    def changes(self) -> dict:
+        """Return the variables modified by `append` since the last call"""
+        if(not self._changed):
+            return {}
+        changed = { key: self._variables[key] for key in self._changed if key in self._variables }
+        self._changed = {}
+        return changed
         
     def remove(self, key: str) -> None:
         if key in self._variables:
@@ -138,22 +192,25 @@ class BagOfVariables:
             self._logger.error(f"Variable '{key}' not found")
         
     def save(self, filePath: str) -> None:
-        output = {}
-        for key in self._variables:
-            if(self._variables[key].sensitive == False):
-                output[key] = self._variables[key].value
-        
-        with open(filePath, 'w') as f:
-            json.dump(output, f)  
+        save_context(filePath, self._variables.to_save())
         
     def interpret(self, excludeInterpret: list = []) -> None:
-        self._interpeter.interpret(excludeInterpret)
+        self._variables.interpret(self._interpeter, excludeInterpret)
         
     def interpretManifest(self, manifest: dict, excludeInterpret: list = []) -> dict:
-        return self._interpeter.interpretDict(manifest, "manifest", excludeInterpret)        
+        return self.render(CompiledTemplate(manifest, excludeInterpret))
+
+    def render(self, template: CompiledTemplate) -> dict:
+        return template.render(self._variables).value
 
     def interpretEvalCondition(self, condition) -> bool:
         return self._interpeter.interpretEvalCondition(condition)
 
+    def close(self) -> None:
+        self._variables.close()
+        for context in self._contexts:
+            context.close()
+        self._contexts = []
+
     def __str__(self) -> str:
         return f'{self._variables}'
\ No newline at end of file
@@ -0,0 +1,137 @@
+from logging import Logger
+from collections.abc import MutableMapping
+from typing import Dict, List
+import ast
+import hashlib
+import json
+import os
+import time
+import yaml
+from lemniscat.core.util.helpers import FileSystem
+from lemniscat.runtime.model.models import Task
+from lemniscat.runtime.plugin.pluginmanager import PluginManager
+from lemniscat.runtime.model.models import TaskStatus
+from .engine_template import CompiledTemplate
+from .engine_worker import changed_variables, snapshot_value
+
+def templates(path: str) -> List[str]:
+    """Return the template files included, directly or not, by a manifest or a template"""
+    result = []
+    def walk(value) -> None:
+        if(isinstance(value, dict)):
+            if(isinstance(value.get('template'), str) and value['template'] not in result):
+                result.append(value['template'])
+                try:
+                    walk(FileSystem.load_configuration_path(value['template']))
+                except (OSError, ValueError, yaml.YAMLError):
+                    pass
+            for item in value.values():
+                walk(item)
+        elif(isinstance(value, list)):
+            for item in value:
+                walk(item)
+    try:
+        walk(FileSystem.load_configuration_path(path))
+    except (OSError, ValueError, yaml.YAMLError):
+        pass
+    return result
+
+class IncrementalCache:
+    """Remember the inputs and the outputs of the tasks, to skip those whose inputs did not change"""
+    _entries: Dict[str, dict]
+
+    def __init__(self) -> None:
+        self._entries = {}
+        self._occurrences = {}
+
+    def reset(self) -> None:
+        """Start a new run: task keys are numbered again from the beginning"""
+        self._occurrences = {}
+
+    def key(self, capability: str, solution: str, step: str, task: Task) -> str:
+        key = f'{capability}/{solution}/{step}/{task.displayName}'
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        return f'{key}#{occurrence}'
+
+    @staticmethod
+    def fingerprint(task: Task, variables: MutableMapping) -> str:
+        """Hash the inputs of a task: its parameters and its condition rendered with the variables of its capability,
+        and the variables they reference. A plugin reading a variable its task does not reference is not run again
+        when only this variable changes"""
+        template = CompiledTemplate({ 'parameters': task.parameters, 'condition': task.condition })
+        inputs = {
+            'task': task.name,
+            'rendered': template.render(variables).value,
+            'variables': sorted((key, snapshot_value(variables[key])) for key in set(template.references) if key in variables)
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def outputs(self, key: str, fingerprint: str) -> dict:
+        """Return the outputs of the task when its inputs did not change, None otherwise"""
+        entry = self._entries.get(key)
+        if(entry is None or entry['fingerprint'] != fingerprint):
+            return None
+        return entry['outputs']
+
+    def snapshot(self, variables: dict) -> Dict[str, str]:
+        return { key: snapshot_value(variable) for key, variable in variables.items() }
+
+    def store(self, key: str, fingerprint: str, before: Dict[str, str], variables: dict) -> None:
+        self._entries[key] = { 'fingerprint': fingerprint, 'outputs': changed_variables(before, variables) }
+
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+class Watcher:
+    """Keep the plugins loaded and re-run the manifest each time one of its files changes"""
+    _logger: Logger
+    _options: dict
+    _cache: IncrementalCache
+
+    def __init__(self, logger: Logger, options: dict, interval: float = 1.0) -> None:
+        self._logger = logger
+        self._options = options
+        self._interval = interval
+        self._cache = IncrementalCache()
+        self._plugins = PluginManager(options)
+        self._plugins.discover_plugins(True)
+
+    def files(self) -> List[str]:
+        try:
+            configFiles = ast.literal_eval(self._options['configFiles'])
+        except (ValueError, SyntaxError):
+            configFiles = []
+        return [self._options['manifest']] + list(configFiles) + templates(self._options['manifest'])
+
+    @staticmethod
+    def __stat(path: str) -> tuple:
+        try:
+            stat = os.stat(path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def run_once(self) -> str:
+        """Run the manifest; a run that fails to start (e.g. an invalid manifest) is logged and reported as failed"""
+        # imported here as the engine itself depends on this module for incremental runs
+        from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+        self._cache.reset()
+        try:
+            engine = OrchestratorEngine(options=self._options, plugins=self._plugins, incremental=self._cache)
+            return engine.start()
+        except Exception as e:
+            self._logger.exception(f'Run failed: {e}')
+            return TaskStatus.FAILED
+
+    def watch(self) -> None:
+        while(True):
+            files = self.files()
+            state = { path: self.__stat(path) for path in files }
+            started = time.perf_counter()
+            status = self.run_once()
+            self._logger.info(f'👀 Run {status} in {time.perf_counter() - started:.2f}s, watching {len(files)} files for changes...')
+            while(all(self.__stat(path) == stat for path, stat in state.items())):
+                time.sleep(self._interval)
+            changed = [path for path, stat in state.items() if self.__stat(path) != stat]
+            self._logger.info(f'👀 Changes detected in: {changed}')
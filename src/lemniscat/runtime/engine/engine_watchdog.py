@@ -0,0 +1,198 @@
+from logging import Logger
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import signal
+import subprocess
+import threading
+import time
+
+_KILL_EXIT_CODE = 124
+_TERMINATE_GRACE = 5.0
+_SIGKILL = getattr(signal, 'SIGKILL', signal.SIGTERM)
+
+def _processes() -> Dict[int, Tuple[int, str]]:
+    """Return the parent pid and the state of every process: read from /proc, or from `ps` where there is none"""
+    processes = {}
+    if(os.path.isdir('/proc')):
+        for name in os.listdir('/proc'):
+            if(not name.isdigit()):
+                continue
+            try:
+                with open(os.path.join('/proc', name, 'stat'), 'rb') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # the command name, between parentheses, may hold spaces: the fields are read after it
+            fields = stat[stat.rindex(b')') + 2:].split()
+            processes[int(name)] = (int(fields[1]), fields[0].decode())
+        return processes
+    try:
+        ps = subprocess.Popen(['ps', '-A', '-o', 'pid=', '-o', 'ppid=', '-o', 'stat='], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        output, _ = ps.communicate()
+    except OSError:
+        return processes
+    for line in output.splitlines():
+        fields = line.split()
+        if(len(fields) == 3 and int(fields[0]) != ps.pid):
+            processes[int(fields[0])] = (int(fields[1]), fields[2][0])
+    return processes
+
+def descendants(pid: int) -> List[int]:
+    """Return the running processes started, directly or not, by a process"""
+    processes = _processes()
+    children = {}
+    for child, (parent, _) in processes.items():
+        children.setdefault(parent, []).append(child)
+    result = []
+    pending = [pid]
+    while(len(pending) > 0):
+        for child in children.get(pending.pop(), []):
+            pending.append(child)
+            if(processes[child][1] != 'Z'):
+                result.append(child)
+    return result
+
+def _signal(pids: List[int], signum: int) -> None:
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+class TaskInterrupted(BaseException):
+    """Raised in a task stopped by the watchdog. Like KeyboardInterrupt, it is not an Exception,
+    so a plugin catching every error cannot swallow it"""
+    reason: str
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+class Watchdog:
+    """Interrupt a task when it exceeds its timeout or when the run is cancelled, and terminate the processes
+    it started: the engine runs one task at a time, so every process below this one at that point belongs to the
+    interrupted task (or to a task left behind earlier). A task is only interrupted on the main thread, through
+    SIGALRM: there, a task not giving control back within the grace period (e.g. stuck in native code) gets the
+    whole process killed. On any other thread the task cannot be interrupted: its processes are terminated and
+    the task is left running in the background"""
+    _logger: Logger
+    grace: float
+
+    def __init__(self, logger: Logger, grace: float = 10.0) -> None:
+        self._logger = logger
+        self.grace = grace
+        self._reason = None
+        self._running = None
+        self._name = None
+        self._timeout = None
+        self._killer = None
+        self._installed = False
+        self._lock = threading.Lock()
+        self._mainThread = threading.main_thread().ident
+
+    @property
+    def cancelled(self) -> bool:
+        return self._reason is not None
+
+    def cancel(self, reason: str) -> None:
+        """Interrupt the running task, if any, and refuse to start the next ones"""
+        with self._lock:
+            if(self._reason is not None):
+                return
+            self._reason = reason
+            if(self._running == 'signal'):
+                signal.pthread_kill(self._mainThread, signal.SIGALRM)
+
+    def run(self, name: str, timeout: Optional[float], function: Callable, **kwargs):
+        """Call `function(**kwargs)` and return its result, or raise `TaskInterrupted`"""
+        if(self._reason is not None):
+            raise TaskInterrupted(self._reason)
+        if(timeout is not None and timeout <= 0):
+            raise TaskInterrupted('No time left in the capability timeout')
+        if(threading.get_ident() == self._mainThread and hasattr(signal, 'setitimer')):
+            return self.__run_with_signal(name, timeout, function, kwargs)
+        return self.__run_in_thread(name, timeout, function, kwargs)
+
+    def __terminate(self, name: str) -> None:
+        # listed before any is signaled: the children of a terminated process are no longer its descendants
+        running = descendants(os.getpid())
+        if(len(running) == 0):
+            return
+        self._logger.warning(f'Terminating {len(running)} processes started by task: {name}')
+        _signal(running, signal.SIGTERM)
+        deadline = time.monotonic() + _TERMINATE_GRACE
+        while(len(running) > 0 and time.monotonic() < deadline):
+            time.sleep(0.05)
+            processes = _processes()
+            running = [pid for pid in running if pid in processes and processes[pid][1] != 'Z']
+        _signal(running, _SIGKILL)
+
+    def __start_killer(self, name: str) -> None:
+        def kill() -> None:
+            self._logger.critical(f'Task: {name} still running {self.grace}s after being interrupted, killing the process')
+            _signal(descendants(os.getpid()), _SIGKILL)
+            os._exit(_KILL_EXIT_CODE)
+        self._killer = threading.Timer(self.grace, kill)
+        self._killer.daemon = True
+        self._killer.start()
+
+    def __on_alarm(self, signum, frame) -> None:
+        if(self._running is None):
+            # a cancellation arriving once the task is over
+            return
+        reason = self._reason or f'Timed out after {self._timeout:.2f}s'
+        self.__start_killer(self._name)
+        raise TaskInterrupted(reason)
+
+    def __run_with_signal(self, name: str, timeout: Optional[float], function: Callable, kwargs: dict):
+        if(not self._installed):
+            # kept installed: a late signal must not reach the default handler, which ends the process
+            signal.signal(signal.SIGALRM, self.__on_alarm)
+            self._installed = True
+        self._name = name
+        self._timeout = timeout
+        with self._lock:
+            self._running = 'signal'
+        try:
+            if(timeout is not None):
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            return function(**kwargs)
+        except TaskInterrupted:
+            # no alarm may interrupt the termination itself
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            with self._lock:
+                self._running = None
+            self.__terminate(name)
+            raise
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            with self._lock:
+                self._running = None
+            if(self._killer is not None):
+                self._killer.cancel()
+                self._killer = None
+
+    def __run_in_thread(self, name: str, timeout: Optional[float], function: Callable, kwargs: dict):
+        # outside of the main thread a task cannot be interrupted: its processes are terminated and it is left behind
+        result = {}
+        def target() -> None:
+            try:
+                result['value'] = function(**kwargs)
+            except BaseException as e:
+                result['error'] = e
+        thread = threading.Thread(target=target, name=f'lem-task-{name}', daemon=True)
+        started = time.monotonic()
+        thread.start()
+        while(thread.is_alive()):
+            thread.join(0.1)
+            reason = self._reason
+            if(reason is None and timeout is not None and time.monotonic() - started >= timeout):
+                reason = f'Timed out after {timeout:.2f}s'
+            if(thread.is_alive() and reason is not None):
+                self.__terminate(name)
+                if(thread.is_alive()):
+                    self._logger.warning(f'Task: {name} left running in the background')
+                raise TaskInterrupted(reason)
+        if('error' in result):
+            raise result['error']
+        return result.get('value')
@@ -0,0 +1,312 @@
+from logging import Logger
+from typing import Dict, List, Optional, Tuple
+import hmac
+import json
+import os
+import select
+import socket
+import ssl
+import struct
+import threading
+from lemniscat.core.model.models import VariableValue
+from lemniscat.runtime.engine.engine_context import encode_value
+from lemniscat.runtime.engine.engine_variables import BagOfVariables
+from lemniscat.runtime.model.models import Solution
+from lemniscat.runtime.plugin.pluginmanager import PluginManager
+from lemniscat.runtime.engine.engine_watchdog import Watchdog
+
+_HEADER = struct.Struct('>Q')
+_TOKEN_VARIABLE = 'LEM_WORKER_TOKEN'
+# the first message, sent before the peer is authenticated, only holds the token
+_AUTH_LIMIT = 4096
+_AUTH_TIMEOUT = 10.0
+# the fields a request must hold, by type
+_REQUEST_FIELDS = {
+    'ping': [],
+    'run': ['capability', 'solution', 'steps', 'requirements', 'variables']
+}
+
+DEFAULT_ADDRESS = 'unix:' + os.path.join('~', '.lemniscat', 'worker.sock')
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """Parse a worker address: `unix:/path/to/socket`, `tcp:host:port` or `host:port` (loopback when the host is empty)"""
+    if(address.startswith('unix:')):
+        return (socket.AF_UNIX, os.path.expanduser(address[len('unix:'):]))
+    if(address.startswith('tcp:')):
+        address = address[len('tcp:'):]
+    host, _, port = address.rpartition(':')
+    return (socket.AF_INET, (host or '127.0.0.1', int(port)))
+
+def worker_token() -> Optional[str]:
+    """The token shared by the coordinator and its workers, read from $LEM_WORKER_TOKEN so it never shows in a command line"""
+    return os.environ.get(_TOKEN_VARIABLE) or None
+
+def send_message(connection: socket.socket, message: dict) -> None:
+    payload = json.dumps(message).encode('utf-8')
+    connection.sendall(_HEADER.pack(len(payload)) + payload)
+
+def __receive_exactly(connection: socket.socket, size: int) -> bytes:
+    chunks = []
+    while(size > 0):
+        chunk = connection.recv(min(size, 1 << 20))
+        if(chunk == b''):
+            raise ConnectionError('Connection closed by peer')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def receive_message(connection: socket.socket, limit: int = None) -> dict:
+    size = _HEADER.unpack(__receive_exactly(connection, _HEADER.size))[0]
+    if(limit is not None and size > limit):
+        raise ValueError(f'Message of {size} bytes refused, the limit is {limit}')
+    return json.loads(__receive_exactly(connection, size).decode('utf-8'))
+
+def encode_variables(variables: dict) -> dict:
+    # the values are encoded as in a context file: a value JSON does not know (e.g. a YAML date) is sent as a string
+    return { key: { 'value': encode_value(variable.value), 'sensitive': variable.sensitive } for key, variable in variables.items() }
+
+def decode_variables(variables: dict) -> dict:
+    return { key: VariableValue(json.loads(variable['value']), variable['sensitive']) for key, variable in variables.items() }
+
+def encode_index(index: dict) -> dict:
+    return { key: encode_value(value) for key, value in index.items() }
+
+def decode_index(index: dict) -> dict:
+    return { key: json.loads(value) for key, value in index.items() }
+
+def invalid_request(request) -> Optional[str]:
+    """Return why a request can not be served, None when it holds the fields of its type"""
+    if(not isinstance(request, dict)):
+        return 'Invalid request: not an object'
+    if(request.get('type') not in _REQUEST_FIELDS):
+        return f"Unknown request: {request.get('type')}"
+    missing = [field for field in _REQUEST_FIELDS[request['type']] if field not in request]
+    if(len(missing) > 0):
+        return f"Invalid request: missing {', '.join(missing)}"
+    if(request['type'] == 'run' and (not isinstance(request['solution'], dict) or not isinstance(request['variables'], dict))):
+        return 'Invalid request: solution and variables must be objects'
+    return None
+
+def changed_variables(before: Dict[str, str], variables: dict) -> dict:
+    """Return the variables added or modified since the snapshot taken before the run"""
+    result = {}
+    for key, variable in variables.items():
+        if(before.get(key) != snapshot_value(variable)):
+            result[key] = variable
+    return result
+
+def snapshot_value(variable: VariableValue) -> str:
+    return json.dumps([variable.value, variable.sensitive], sort_keys=True, default=str)
+
+class WorkerClient:
+    """Send requests to a `lem worker` process. The connection is authenticated with the shared token;
+    a TCP worker is reached through TLS only, its certificate being checked against `cafile` (or the system CAs)"""
+    address: str
+
+    def __init__(self, address: str, timeout: float = None, token: str = None, cafile: str = None) -> None:
+        self.address = address
+        self._timeout = timeout
+        self._token = token or worker_token()
+        self._cafile = cafile or os.environ.get('LEM_WORKER_CA')
+        self._connection = None
+
+    def __enter__(self) -> 'WorkerClient':
+        if(self._token is None):
+            raise PermissionError(f'No worker token: set ${_TOKEN_VARIABLE}')
+        family, address = parse_address(self.address)
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            connection.settimeout(self._timeout)
+            if(family == socket.AF_INET):
+                context = ssl.create_default_context(cafile=self._cafile)
+                connection = context.wrap_socket(connection, server_hostname=address[0])
+            connection.connect(address)
+            send_message(connection, { 'type': 'auth', 'token': self._token })
+            if(receive_message(connection, _AUTH_LIMIT).get('status') != 'ok'):
+                raise PermissionError(f'Worker {self.address} refused the token')
+        except BaseException:
+            connection.close()
+            raise
+        self._connection = connection
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if(self._connection is not None):
+            try:
+                self._connection.close()
+            finally:
+                self._connection = None
+
+    def abort(self) -> None:
+        """Break the connection from another thread: the pending request fails and the worker cancels it"""
+        connection = self._connection
+        if(connection is not None):
+            try:
+                # the plain socket is shut down: the TLS state belongs to the thread reading the response
+                socket.socket.shutdown(connection, socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def request(self, message: dict) -> dict:
+        send_message(self._connection, message)
+        return receive_message(self._connection)
+
+    def ping(self) -> bool:
+        try:
+            with self as client:
+                return client.request({ 'type': 'ping' }).get('status') == 'ok'
+        except (OSError, ValueError):
+            return False
+
+class WorkerServer:
+    """A `lem worker` process: run the solutions sent by a coordinator, one at a time. A worker runs any plugin
+    task it is sent, so only a peer holding the shared token is served: a Unix socket is only accessible to its
+    owner, a TCP port requires TLS (`tlsCert` and `tlsKey` options) as the requests carry sensitive variables"""
+    _logger: Logger
+    _options: dict
+    _plugins: Dict[str, object]
+
+    def __init__(self, logger: Logger, address: str, options: dict) -> None:
+        self._logger = logger
+        self._options = options
+        self._plugins = {}
+        self.address = address
+        self._token = options.get('token') or worker_token()
+        if(self._token is None):
+            raise ValueError(f'A worker token is required: set ${_TOKEN_VARIABLE} on the worker and on the coordinator')
+        family, bindAddress = parse_address(address)
+        self._tls = None
+        if(family == socket.AF_INET):
+            if(options.get('tlsCert') is None or options.get('tlsKey') is None):
+                raise ValueError('A TCP worker requires --tlsCert and --tlsKey, use unix:<path> for a local worker')
+            self._tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self._tls.load_cert_chain(options['tlsCert'], options['tlsKey'])
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        if(family == socket.AF_UNIX):
+            directory = os.path.dirname(bindAddress)
+            if(directory != ''):
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            if(os.path.exists(bindAddress)):
+                os.remove(bindAddress)
+            # the socket file is created accessible to its owner only
+            umask = os.umask(0o177)
+            try:
+                self._socket.bind(bindAddress)
+            finally:
+                os.umask(umask)
+        else:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(bindAddress)
+        self._socket.listen()
+
+    def __plugin_manager(self, requirements: List[dict]) -> PluginManager:
+        key = json.dumps(requirements, sort_keys=True)
+        if(key not in self._plugins):
+            # plugins are loaded once per set of requirements and reused for the next solutions
+            plugins = PluginManager({ 'manifest': None, 'verbosity': self._options['verbosity'], 'requirements': requirements })
+            plugins.discover_plugins(True)
+            self._plugins.clear()
+            self._plugins[key] = plugins
+        return self._plugins[key]
+
+    def __monitor(self, connection: socket.socket, watchdog: Watchdog, finished: threading.Event) -> None:
+        # the coordinator sends nothing more: the connection is only readable once it is closed.
+        # polled rather than read, as a TLS connection must not be read while the response is written
+        while(not finished.is_set()):
+            try:
+                readable, _, _ = select.select([connection], [], [], 0.2)
+            except (OSError, ValueError):
+                return
+            if(len(readable) > 0):
+                if(not finished.is_set()):
+                    watchdog.cancel('Cancelled by the coordinator')
+                return
+
+    def __authenticate(self, connection: socket.socket) -> bool:
+        connection.settimeout(_AUTH_TIMEOUT)
+        hello = receive_message(connection, _AUTH_LIMIT)
+        token = hello.get('token') if isinstance(hello, dict) and hello.get('type') == 'auth' else None
+        if(not isinstance(token, str) or not hmac.compare_digest(token.encode('utf-8'), self._token.encode('utf-8'))):
+            send_message(connection, { 'status': 'Failed', 'errors': ['Unauthorized'] })
+            return False
+        send_message(connection, { 'status': 'ok' })
+        connection.settimeout(None)
+        return True
+
+    def __run(self, request: dict, watchdog: Watchdog) -> dict:
+        # imported here as the engine itself depends on this module to dispatch solutions
+        from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+        variables = decode_variables(request['variables'])
+        before = { key: snapshot_value(variable) for key, variable in variables.items() }
+        bag = BagOfVariables.from_variables(self._logger, variables, decode_index(request.get('index', {})))
+        engine = OrchestratorEngine(options={
+            'manifest': None,
+            'verbosity': self._options['verbosity'],
+            'steps': repr(request['steps']),
+            'outputContext': None,
+            'metricsStore': self._options.get('metricsStore'),
+            'metricsManifest': request.get('manifest')
+        }, plugins=self.__plugin_manager(request['requirements']), bagOfVariables=bag, watchdog=watchdog)
+        solution = Solution(bag._variables, **request['solution'])
+        try:
+            status = engine.runSolution(request['capability'], solution, request.get('timeout'))
+            bag.remove('capability')
+            return {
+                'status': status,
+                'tasks': [task.status for task in solution.tasks],
+                'variables': encode_variables(changed_variables(before, bag._variables))
+            }
+        finally:
+            engine.close()
+
+    def __handle(self, connection: socket.socket) -> None:
+        with connection:
+            if(not self.__authenticate(connection)):
+                self._logger.warning('Request refused: invalid worker token')
+                return
+            request = receive_message(connection)
+            error = invalid_request(request)
+            if(error is not None):
+                self._logger.warning(f'Request refused: {error}')
+                send_message(connection, { 'status': 'Failed', 'errors': [error] })
+                return
+            if(request['type'] == 'ping'):
+                send_message(connection, { 'status': 'ok' })
+                return
+            self._logger.info(f"🦾 Running solution: {request['solution']['solution']} of capability: {request['capability']}")
+            watchdog = Watchdog(self._logger)
+            finished = threading.Event()
+            threading.Thread(target=self.__monitor, args=(connection, watchdog, finished), daemon=True).start()
+            try:
+                response = self.__run(request, watchdog)
+            except Exception as e:
+                self._logger.error(f'Solution failed on worker: {e}')
+                response = { 'status': 'Failed', 'errors': [str(e)], 'tasks': [], 'variables': {} }
+            finally:
+                finished.set()
+            if(watchdog.cancelled):
+                self._logger.warning(f"Solution: {request['solution']['solution']} cancelled by the coordinator")
+                return
+            send_message(connection, response)
+            connection.shutdown(socket.SHUT_RDWR)
+
+    def serve_forever(self) -> None:
+        self._logger.info(f'Worker listening on: {self.address}')
+        try:
+            while(True):
+                connection, _ = self._socket.accept()
+                try:
+                    if(self._tls is not None):
+                        connection.settimeout(_AUTH_TIMEOUT)
+                        connection = self._tls.wrap_socket(connection, server_side=True)
+                    self.__handle(connection)
+                except Exception as e:
+                    # a peer must not be able to stop the worker
+                    self._logger.error(f'Unable to handle request: {e}')
+                finally:
+                    connection.close()
+        finally:
+            self._socket.close()
@@ -1,5 +1,6 @@
 import argparse
 import os
+import sys
 from lemniscat.runtime.version import __version__, __release_date__
 
 ## Debugging
@@ -10,6 +11,19 @@ if os.environ.get('LEM_DEBUG') == '1':
     print(sys.path)
 
 from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+from lemniscat.runtime.engine.engine_metrics import MetricsStore, MetricsReport
+from lemniscat.runtime.engine.engine_estimate import Estimator
+from lemniscat.runtime.engine.engine_worker import WorkerServer, DEFAULT_ADDRESS
+from lemniscat.runtime.engine.engine_watch import Watcher
+from lemniscat.runtime.engine.engine_variables import BagOfVariables
+from lemniscat.runtime.engine.engine_output import OutputContextReader, open_binary_context
+from lemniscat.runtime.engine.engine_context import is_binary_context
+from lemniscat.runtime.engine.engine_store import VariableStore, variable_value
+from lemniscat.runtime.engine.engine_shard import parse_shard
+from lemniscat.runtime.plugin.bundle import PluginBundle
+from lemniscat.runtime.plugin.pluginmanager import PluginManager
+from lemniscat.runtime.model.models import DependencyModule
+from lemniscat.core.util.helpers import LogUtil
 
 def __description() -> str:
     return "Lemniscat is a simple and lightweight orchestrator for running a sequence of tasks. It is designed to be used in a CI/CD pipeline, but can be used for any other purpose as well. It is designed to be simple and easy to use, but also powerful and flexible."
@@ -18,6 +32,20 @@ def __description() -> str:
 def __usage() -> str:
     return "lem --manifest [path to your manifest file] --steps [list of steps to execute]"
 
+def __variable_store(option: str) -> str:
+    try:
+        VariableStore.check(option)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return option
+
+def __shard(option: str) -> str:
+    try:
+        parse_shard(option)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return option
+
 def __init_cli() -> argparse:
     parser = argparse.ArgumentParser(description=__description(), usage=__usage())
     parser.add_argument(
@@ -38,7 +66,7 @@ def __init_cli() -> argparse:
     )
     parser.add_argument(
         '-c', '--configFiles', default='[]', help="""
-        (Optional) Supply a list of config files which should be loaded. The default is []
+        (Optional) Supply a list of config files which should be loaded (.yaml, .yml, .json or .lemctx). The default is []
         """
     )
     parser.add_argument(
@@ -48,9 +76,163 @@ def __init_cli() -> argparse:
     )
     parser.add_argument(
         '-o', '--outputContext', default=None, help="""
-        (Optional) Supply a path to the output context. The default is None
+        (Optional) Supply a path to the output context. A path ending with .lemctx writes the binary context,
+        sensitive variables included, to be passed to the next run through --configFiles. The default is None
+        """
+    )
+    parser.add_argument(
+        '--metricsStore', default=None, help="""
+        (Optional) Record the durations in a local run-history metrics store: a path, or 'default' for ~/.lemniscat/metrics.jsonl.
+        Recording is off unless this option or $LEM_METRICS_STORE is set
+        """
+    )
+    parser.add_argument(
+        '-w', '--workers', default='[]', help="""
+        (Optional) Supply a list of `lem worker` addresses (host:port or unix:/path) the capabilities are dispatched to.
+        The token shared with the workers is read from $LEM_WORKER_TOKEN. The default is [] (run locally)
+        """
+    )
+    parser.add_argument(
+        '--workerCa', default=None, help="""
+        (Optional) Supply the CA bundle (PEM) checking the certificates of the TCP workers. The default is $LEM_WORKER_CA or the system CAs
+        """
+    )
+    parser.add_argument(
+        '--variableStore', default='memory', type=__variable_store, help="""
+        (Optional) Supply where the variables are kept: memory, sqlite (temporary database) or sqlite:<path> (a new database, or one created by a previous run). The default is memory
+        """
+    )
+    parser.add_argument(
+        '--bundleDir', default=None, help="""
+        (Optional) Supply the directory of the plugin bundles built by `lem bundle`. The default is $LEM_BUNDLE_DIR or ~/.lemniscat/bundles
+        """
+    )
+    parser.add_argument(
+        '--shard', default=None, type=__shard, help="""
+        (Optional) Only run the part <index>/<count> (e.g. 1/3) of the selected solutions, to split a run across CI agents; capabilities linked by a dependsOn stay on the same agent. The default is None (run everything)
+        """
+    )
+    return parser
+
+def __init_bundle_cli() -> argparse:
+    parser = argparse.ArgumentParser(prog='lem bundle', description="Install the plugins of a manifest and their requirements into a snapshot loaded at startup without pip nor network.")
+    parser.add_argument(
+        '-m', '--manifest', required=True, help="""
+        (Required) Supply the manifest whose requirements are bundled
+        """
+    )
+    parser.add_argument(
+        '-v', '--verbosity', default='INFO', help="""
+        Specify log verbosity which should use. Choose between the following options
+        CRITICAL, ERROR, WARNING, INFO, DEBUG
+        """
+    )
+    parser.add_argument(
+        '--bundleDir', default=None, help="""
+        (Optional) Supply the directory of the plugin bundles. The default is $LEM_BUNDLE_DIR or ~/.lemniscat/bundles
+        """
+    )
+    parser.add_argument(
+        '--force', action='store_true', help="""
+        (Optional) Rebuild the bundle even if it already exists
+        """
+    )
+    return parser
+
+def __init_merge_cli() -> argparse:
+    parser = argparse.ArgumentParser(prog='lem merge', description="Merge the output contexts of the shards of a run into one output context.")
+    parser.add_argument(
+        'inputs', nargs='+', help="""
+        (Required) Supply the output contexts of the shards (.json or .lemctx)
+        """
+    )
+    parser.add_argument(
+        '-o', '--outputContext', required=True, help="""
+        (Required) Supply a path to the merged output context
+        """
+    )
+    parser.add_argument(
+        '-v', '--verbosity', default='INFO', help="""
+        Specify log verbosity which should use. Choose between the following options
+        CRITICAL, ERROR, WARNING, INFO, DEBUG
+        """
+    )
+    return parser
+
+def __init_worker_cli() -> argparse:
+    parser = argparse.ArgumentParser(prog='lem worker', description="Run the solutions dispatched by a coordinator started with --workers.")
+    parser.add_argument(
+        '-l', '--listen', default=DEFAULT_ADDRESS, help=f"""
+        (Optional) Supply the address to listen on: unix:/path/to/socket, or host:port which requires --tlsCert and --tlsKey.
+        The token shared with the coordinator is read from $LEM_WORKER_TOKEN. The default is {DEFAULT_ADDRESS}
+        """
+    )
+    parser.add_argument(
+        '--tlsCert', default=None, help="""
+        (Optional) Supply the certificate (PEM) served to the coordinators when listening on TCP. The default is None
+        """
+    )
+    parser.add_argument(
+        '--tlsKey', default=None, help="""
+        (Optional) Supply the private key (PEM) of the certificate served when listening on TCP. The default is None
+        """
+    )
+    parser.add_argument(
+        '-v', '--verbosity', default='INFO', help="""
+        Specify log verbosity which should use. Choose between the following options
+        CRITICAL, ERROR, WARNING, INFO, DEBUG
+        """
+    )
+    parser.add_argument(
+        '--metricsStore', default=None, help="""
+        (Optional) Record the durations in a local run-history metrics store: a path, or 'default' for ~/.lemniscat/metrics.jsonl.
+        Recording is off unless this option or $LEM_METRICS_STORE is set
+        """
+    )
+    return parser
+
+def __init_stats_cli() -> argparse:
+    parser = argparse.ArgumentParser(prog='lem stats', description="Report the duration percentiles of previous runs and flag regressions.")
+    parser.add_argument(
+        '-m', '--manifest', default=None, help="""
+        (Optional) Only report the runs of this manifest. The default is all manifests
+        """
+    )
+    parser.add_argument(
+        '-k', '--kind', default=None, help="""
+        (Optional) Only report one kind of item: task, solution, capability, phase or plugin. The default is all kinds
+        """
+    )
+    parser.add_argument(
+        '--metricsStore', default=None, help="""
+        (Optional) Supply a path to the local run-history metrics store. The default is $LEM_METRICS_STORE or ~/.lemniscat/metrics.jsonl
+        """
+    )
+    parser.add_argument(
+        '--window', type=int, default=20, help="""
+        (Optional) Number of previous runs used as the baseline of the last run. The default is 20
+        """
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=1.2, help="""
+        (Optional) Ratio between the last run and the baseline median above which a regression is flagged. The default is 1.2
+        """
+    )
+    parser.add_argument(
+        '--minDelta', type=float, default=0.5, help="""
+        (Optional) Minimum slowdown in seconds for a regression to be flagged. The default is 0.5
+        """
+    )
+    parser.add_argument(
+        '--openMetrics', default=None, help="""
+        (Optional) Supply a path where an OpenMetrics textfile is written for the node exporter. The default is None
+        """
+    )
+    parser.add_argument(
+        '--failOnRegression', action='store_true', help="""
+        (Optional) Exit with code 1 when a regression is flagged
         """
-    )                  
+    )
     return parser
 
 
@@ -78,7 +260,140 @@ def __init_app(parameters: dict) -> None:
     if(status == 'Failed'):
         exit(1)
 
+def __init_estimate_cli() -> argparse:
+    parser = __init_cli()
+    parser.prog = 'lem estimate'
+    parser.usage = None
+    parser.description = "Estimate the duration and the critical path of a run from previous runs, without invoking plugins."
+    return parser
+
+def __init_watch_cli() -> argparse:
+    parser = __init_cli()
+    parser.prog = 'lem watch'
+    parser.usage = None
+    parser.description = "Keep the plugins loaded and re-run the tasks whose inputs changed each time the manifest, a template or a config file changes."
+    parser.add_argument(
+        '--interval', type=float, default=1.0, help="""
+        (Optional) Number of seconds between two checks of the watched files. The default is 1.0
+        """
+    )
+    return parser
+
+def __stats(argv: list) -> None:
+    __cli_args = __init_stats_cli().parse_args(argv)
+    store = MetricsStore.from_option(__cli_args.metricsStore, record=False)
+    if(store is None):
+        print("Metrics store is disabled")
+        exit(1)
+    manifest = os.path.abspath(__cli_args.manifest) if __cli_args.manifest is not None else None
+    records = [record for record in store.read(manifest) if __cli_args.kind is None or record['kind'] == __cli_args.kind]
+    report = MetricsReport(records, __cli_args.window, __cli_args.threshold, __cli_args.minDelta)
+    print(report.to_text())
+    print("")
+    print(f"{len(report.rows)} items, {len(report.regressions)} regressions ({store.path})")
+    if(__cli_args.openMetrics is not None):
+        report.save_openmetrics(__cli_args.openMetrics)
+        print(f"OpenMetrics exported to: {__cli_args.openMetrics}")
+    if(__cli_args.failOnRegression and len(report.regressions) > 0):
+        exit(1)
+
+def __estimate(argv: list) -> None:
+    __cli_args = __init_estimate_cli().parse_args(argv)
+    engine = OrchestratorEngine(options={
+        'manifest': __cli_args.manifest,
+        'verbosity': __cli_args.verbosity,
+        'steps': __cli_args.steps,
+        'configFiles': __cli_args.configFiles,
+        'extraVariables': __cli_args.extraVariables,
+        'outputContext': None,
+        'metricsStore': __cli_args.metricsStore,
+        'variableStore': __cli_args.variableStore,
+        'bundleDir': __cli_args.bundleDir,
+        'shard': __cli_args.shard
+    })
+    try:
+        store = MetricsStore.from_option(__cli_args.metricsStore, record=False)
+        records = store.read(engine.manifest) if store is not None else []
+        estimate = Estimator(engine.plan(), records, engine.predecessors)
+    finally:
+        engine.close()
+    print(estimate.to_text())
+
+def __worker(argv: list) -> None:
+    __cli_args = __init_worker_cli().parse_args(argv)
+    logger = LogUtil.create(__cli_args.verbosity)
+    try:
+        WorkerServer(logger, __cli_args.listen, {
+            'verbosity': __cli_args.verbosity,
+            'metricsStore': __cli_args.metricsStore,
+            'tlsCert': __cli_args.tlsCert,
+            'tlsKey': __cli_args.tlsKey
+        }).serve_forever()
+    except ValueError as e:
+        logger.error(f'Unable to start the worker: {e}')
+        exit(1)
+    except KeyboardInterrupt:
+        logger.info('Worker stopped')
+
+def __watch(argv: list) -> None:
+    __cli_args = __init_watch_cli().parse_args(argv)
+    options = {
+        'manifest': __cli_args.manifest,
+        'verbosity': __cli_args.verbosity,
+        'steps': __cli_args.steps,
+        'configFiles': __cli_args.configFiles,
+        'extraVariables': __cli_args.extraVariables,
+        'outputContext': __cli_args.outputContext,
+        'metricsStore': __cli_args.metricsStore,
+        'variableStore': __cli_args.variableStore,
+        'bundleDir': __cli_args.bundleDir,
+        'shard': __cli_args.shard
+    }
+    try:
+        Watcher(LogUtil.create(__cli_args.verbosity), options, __cli_args.interval).watch()
+    except KeyboardInterrupt:
+        __print_program_end()
+
+def __bundle(argv: list) -> None:
+    __cli_args = __init_bundle_cli().parse_args(argv)
+    logger = LogUtil.create(__cli_args.verbosity)
+    requirements = PluginManager({ 'manifest': __cli_args.manifest, 'verbosity': __cli_args.verbosity, 'bundleDir': __cli_args.bundleDir }).requirements
+    bundle = PluginBundle(logger, __cli_args.bundleDir)
+    print(bundle.create([DependencyModule(**requirement) for requirement in requirements], __cli_args.force))
+
+def __merge(argv: list) -> None:
+    __cli_args = __init_merge_cli().parse_args(argv)
+    logger = LogUtil.create(__cli_args.verbosity)
+    bag = BagOfVariables.from_variables(logger, {})
+    for path in __cli_args.inputs:
+        if(is_binary_context(path)):
+            context = open_binary_context(path)
+            values = dict(context.items())
+            context.close()
+        else:
+            values = { key: variable_value(value, False) for key, value in OutputContextReader(path).load().items() }
+        for key, variable in values.items():
+            current = bag.get(key) if key in bag._variables else None
+            if(current is not None and current.value != variable.value):
+                logger.warning(f"Variable '{key}' differs between shards, keeping the value of: {path}")
+            bag.set(key, variable.value, variable.sensitive)
+        logger.info(f"{len(values)} variables merged from: {path}")
+    bag.save(__cli_args.outputContext)
+    logger.info(f"Output context saved to: {__cli_args.outputContext}")
+
+__COMMANDS = {
+    'stats': __stats,
+    'estimate': __estimate,
+    'worker': __worker,
+    'watch': __watch,
+    'bundle': __bundle,
+    'merge': __merge
+}
+
 def lem() -> None:
+    if(len(sys.argv) > 1 and sys.argv[1] in __COMMANDS):
+        __COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
     __cli_args = __init_cli().parse_args()
     __init_app({
         'manifest': __cli_args.manifest,
@@ -86,7 +401,13 @@ def lem() -> None:
         'steps': __cli_args.steps,
         'configFiles': __cli_args.configFiles,
         'extraVariables': __cli_args.extraVariables,
-        'outputContext': __cli_args.outputContext
+        'outputContext': __cli_args.outputContext,
+        'metricsStore': __cli_args.metricsStore,
+        'variableStore': __cli_args.variableStore,
+        'bundleDir': __cli_args.bundleDir,
+        'shard': __cli_args.shard,
+        'workers': __cli_args.workers,
+        'workerCa': __cli_args.workerCa
     })
 
 if __name__ == '__main__':
@@ -1,9 +1,65 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from enum import Enum
+from typing import Dict, List, Optional
 from lemniscat.core.model.models import VariableValue
-from lemniscat.core.util.helpers import LogUtil, FileSystem, Interpreter
+from lemniscat.runtime.engine.engine_template import load_template, _copy
+import json
+import sys
 import uuid
 
+def stable_id(*parts) -> str:
+    """Return an id derived from the position of an item in the manifest, the same on every run and every agent"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, 'lemniscat:' + '/'.join(str(part) for part in parts)))
+
+class TaskStatus(str, Enum):
+    """The status of a task, a solution or a phase; it still compares equal to its name"""
+    PENDING = 'Pending'
+    RUNNING = 'Running'
+    FINISHED = 'Finished'
+    FAILED = 'Failed'
+
+    def __str__(self) -> str:
+        return self.value
+
+STEPS = ['pre', 'pre-clean', 'run', 'run-clean', 'post', 'post-clean']
+_STEP_BITS = { step: 1 << position for position, step in enumerate(STEPS) }
+
+def steps_mask(steps: List[str]) -> int:
+    """Return the bitmask of a list of steps"""
+    mask = 0
+    for step in steps or []:
+        mask |= _STEP_BITS.get(step, 0)
+    return mask
+
+def intern_string(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _intern_tree(value):
+    # only the keys: values are mostly unique and rendered templates already share their literal strings
+    if(isinstance(value, dict)):
+        return { intern_string(key): _intern_tree(item) for key, item in value.items() }
+    if(isinstance(value, list)):
+        return [_intern_tree(item) for item in value]
+    return value
+
+def shared_tree(value, trees: Dict[int, list] = None):
+    """Return an equal tree already in `trees`, the trees of the other tasks of the solution, so identical
+    parameters (e.g. of the tasks included from the same template) are stored once. Shared trees must not be mutated."""
+    if(not isinstance(value, (dict, list))):
+        return value
+    if(trees is None):
+        return _intern_tree(value)
+    try:
+        key = hash(json.dumps(value, sort_keys=True))
+    except (TypeError, ValueError):
+        return _intern_tree(value)
+    for tree in trees.get(key, []):
+        if(tree == value):
+            return tree
+    tree = _intern_tree(value)
+    trees.setdefault(key, []).append(tree)
+    return tree
+
 @dataclass
 class PluginRunTimeOption(object):
     main: str
@@ -47,32 +103,58 @@ class PluginConfig:
     requirements: Optional[List[DependencyModule]]
 
 
-@dataclass
+@dataclass(slots=True)
 class Task:
-    id: str
-    status: str
+    # manifests may hold tens of thousands of tasks: the id is kept as bytes, the steps as a bitmask,
+    # the names are interned and identical parameters are shared (see `shared_tree`)
+    _id: bytes
+    status: TaskStatus
     name: str
     condition: str
     displayName: str
-    steps: List[str]
-    parameters: dict
+    stepsMask: int
+    _parameters: object
+    timeout: float
     
-    def __init__(self, **kwargs) -> None:
-        self.name = kwargs['task']
-        self.displayName = kwargs['displayName']
-        if(self.displayName is None):
-            self.displayName = self.name
+    def __init__(self, trees: Dict[int, list] = None, **kwargs) -> None:
+        self.name = intern_string(kwargs['task'])
+        displayName = kwargs['displayName']
+        if(displayName is None):
+            displayName = self.name
         if(kwargs.__contains__('prefix')):
             val = kwargs['prefix']
-            self.displayName = f'{val}{self.displayName}'
-        self.steps = kwargs['steps']
-        self.parameters = kwargs['parameters']
+            displayName = f'{val}{displayName}'
+        self.displayName = displayName
+        self.stepsMask = steps_mask(kwargs['steps'])
+        self._parameters = shared_tree(kwargs['parameters'], trees)
         if(kwargs.__contains__('condition')):
-            self.condition = kwargs['condition']
+            self.condition = intern_string(kwargs['condition'])
         else:
             self.condition = None
-        self.id = str(uuid.uuid4())
-        self.status = 'Pending'
+        self.timeout = kwargs.get('timeout')
+        # set once by the solution or the phase holding the task, which makes it unique with its position
+        self._id = None
+        self.status = TaskStatus.PENDING
+
+    @property
+    def id(self) -> str:
+        return str(uuid.UUID(bytes=self._id)) if self._id is not None else None
+
+    @id.setter
+    def id(self, value: str) -> None:
+        self._id = uuid.UUID(value).bytes
+
+    @property
+    def steps(self) -> List[str]:
+        return [step for step in STEPS if self.stepsMask & _STEP_BITS[step]]
+
+    @property
+    def parameters(self) -> dict:
+        # a copy, as the plugins interpret the parameters in place
+        return _copy(self._parameters)
+
+    def to_dict(self) -> dict:
+        return { 'task': self.name, 'displayName': self.displayName, 'steps': self.steps, 'parameters': self.parameters, 'condition': self.condition, 'timeout': self.timeout }
 
 @dataclass
 class Template:
@@ -93,9 +175,8 @@ class Template:
         if(kwargs.__contains__('condition')):
             self.condition = kwargs['condition']
     
-    def getTasks(self) -> List[Task]:
-        tasks = FileSystem.load_configuration_path(self.path)
-        Interpreter(LogUtil.root, self._variables).interpretDict(tasks, excludeInterpret=['condition'])
+    def getTasks(self, trees: Dict[int, list] = None) -> List[Task]:
+        tasks = load_template(self.path, excludeInterpret=['condition']).render(self._variables).value
         result = []
         for task in tasks['tasks']:
             task['prefix'] = self.displayName
@@ -105,94 +186,112 @@ class Template:
                 task['condition'] = self.condition
                 
             if(dict(task).keys().__contains__('template')):
-                result.extend(Template(self._variables, **task).getTasks())
+                result.extend(Template(self._variables, **task).getTasks(trees))
             else:
-                result.append(Task(**task))              
+                result.append(Task(trees, **task))              
         return result
 
-@dataclass
+@dataclass(slots=True)
 class Solution:
     id: str
-    status: str
+    status: TaskStatus
     name: str
     description: str
     tasks: Optional[List[Task]]
+    capability: str
     
     def tasks_byStep(self, step: str) -> List[Task]:
-        return [task for task in self.tasks if step in task.steps and task.status == 'Pending']
+        bit = _STEP_BITS.get(step, 0)
+        return [task for task in self.tasks if task.stepsMask & bit and task.status == TaskStatus.PENDING]
     
     def pre_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'pre' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('pre')
     
     def run_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'run' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('run')
     
     def post_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'post' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('post')
 
     def preclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'pre-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('pre-clean')
 
     def runclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'run-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('run-clean')
 
     def postclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'post-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('post-clean')
     
     def __init__(self, variables: dict, **kwargs) -> None:
-        self.name = kwargs['solution']
+        self.name = intern_string(kwargs['solution'])
+        self.description = kwargs.get('description')
+        self.capability = intern_string(kwargs.get('capability'))
         self.tasks = []
+        # the parameter trees shared by the tasks of this solution only
+        trees = {}
         for task in kwargs['tasks']:
             if(dict(task).keys().__contains__('template')):
-                self.tasks.extend(Template(variables, **task).getTasks())
+                self.tasks.extend(Template(variables, **task).getTasks(trees))
             else:
-                self.tasks.append(Task(**task))    
-        self.id = str(uuid.uuid4())
-        self.status = 'Pending'
+                self.tasks.append(Task(trees, **task))    
+        self.id = stable_id(self.capability, self.name)
+        for index, task in enumerate(self.tasks):
+            task.id = stable_id(self.capability, self.name, index, task.name)
+        self.status = TaskStatus.PENDING
 
-@dataclass
+    def to_dict(self) -> dict:
+        return { 'solution': self.name, 'capability': self.capability, 'tasks': [task.to_dict() for task in self.tasks] }
+
+@dataclass(slots=True)
 class Phase:
     id: str
-    status: str
+    status: TaskStatus
     tasks: Optional[List[Task]]
     
     def tasks_byStep(self, step: str) -> List[Task]:
-        return [task for task in self.tasks if step in task.steps and task.status == 'Pending']
+        bit = _STEP_BITS.get(step, 0)
+        return [task for task in self.tasks if task.stepsMask & bit and task.status == TaskStatus.PENDING]
     
     def pre_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'pre' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('pre')
     
     def run_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'run' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('run')
     
     def post_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'post' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('post')
 
     def preclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'pre-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('pre-clean')
 
     def runclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'run-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('run-clean')
 
     def postclean_tasks(self) -> List[Task]:
-        return [task for task in self.tasks if 'post-clean' in task.steps and task.status == 'Pending']
+        return self.tasks_byStep('post-clean')
     
     def __init__(self, variables: dict, **kwargs) -> None:
         self.tasks = []
+        trees = {}
         for task in kwargs['tasks']:
             if(dict(task).keys().__contains__('template')):
-                self.tasks.extend(Template(variables, **task).getTasks())
+                self.tasks.extend(Template(variables, **task).getTasks(trees))
             else:
-                self.tasks.append(Task(**task))    
-        self.id = str(uuid.uuid4())
-        self.status = 'Pending'
+                self.tasks.append(Task(trees, **task))    
+        self.id = stable_id(kwargs.get('name'))
+        for index, task in enumerate(self.tasks):
+            task.id = stable_id(kwargs.get('name'), index, task.name)
+        self.status = TaskStatus.PENDING
 
 @dataclass
 class Capabilities:
     capability: dict
     order: List[str] = None
+    dependsOn: dict = None
+    timeout: dict = None
     
     def __reorder(self, capability: str, dependsOn: List[str]) -> None:
+        self.dependsOn[capability] = dependsOn
         idx = self.order.index(capability)
         self.order.pop(idx)
         newPosition = 0 
@@ -201,55 +300,93 @@ class Capabilities:
                 newPosition = self.order.index(item)
         self.order.insert(newPosition + 1, capability)
     
+    def predecessors(self, reverse: bool = False) -> dict:
+        """Return the capabilities each capability waits for: those of its `dependsOn`, otherwise the one before it
+        in the order the engine runs them, so that only `dependsOn` lets capabilities run in parallel
+        (both reversed for clean steps)"""
+        explicit = {}
+        for capability, dependsOn in self.dependsOn.items():
+            for dependency in dependsOn:
+                if(reverse):
+                    explicit.setdefault(dependency, []).append(capability)
+                else:
+                    explicit.setdefault(capability, []).append(dependency)
+        order = list(reversed(self.order)) if reverse else self.order
+        result = {}
+        for position, capability in enumerate(order):
+            if(capability in explicit):
+                result[capability] = explicit[capability]
+            else:
+                result[capability] = [order[position - 1]] if position > 0 else []
+        return { capability: result[capability] for capability in self.order }
+
     def __init__(self, variables: dict, **kwargs) -> None:
         self.capability = {}
+        self.dependsOn = {}
+        self.timeout = {}
         self.order = ['code', 'build', 'test', 'deploy', 'release', 'operate', 'monitor', 'plan']
         if kwargs['code'] is not None:
-            self.capability['code'] = list(map(lambda x: Solution(variables, **x), kwargs['code']['solutions']))
+            self.capability['code'] = list(map(lambda x: Solution(variables, capability='code', **x), kwargs['code']['solutions']))
             if kwargs['code'].__contains__('dependsOn'):
                 self.__reorder('code', kwargs['code']['dependsOn'])
+            if kwargs['code'].__contains__('timeout'):
+                self.timeout['code'] = kwargs['code']['timeout']
         else:
             self.capability['code'] = None
         if kwargs['build'] is not None:    
-            self.capability['build'] = list(map(lambda x: Solution(variables, **x), kwargs['build']['solutions']))
+            self.capability['build'] = list(map(lambda x: Solution(variables, capability='build', **x), kwargs['build']['solutions']))
             if kwargs['build'].__contains__('dependsOn'):
                 self.__reorder('build', kwargs['build']['dependsOn'])
+            if kwargs['build'].__contains__('timeout'):
+                self.timeout['build'] = kwargs['build']['timeout']
         else:
             self.capability['build'] = None
         if kwargs['test'] is not None:    
-            self.capability['test'] = list(map(lambda x: Solution(variables, **x), kwargs['test']['solutions']))
+            self.capability['test'] = list(map(lambda x: Solution(variables, capability='test', **x), kwargs['test']['solutions']))
             if kwargs['test'].__contains__('dependsOn'):
                 self.__reorder('test', kwargs['test']['dependsOn'])
+            if kwargs['test'].__contains__('timeout'):
+                self.timeout['test'] = kwargs['test']['timeout']
         else:
             self.capability['test'] = None
         if kwargs['deploy'] is not None:    
-            self.capability['deploy'] = list(map(lambda x: Solution(variables, **x), kwargs['deploy']['solutions']))
+            self.capability['deploy'] = list(map(lambda x: Solution(variables, capability='deploy', **x), kwargs['deploy']['solutions']))
             if kwargs['deploy'].__contains__('dependsOn'):
                 self.__reorder('deploy', kwargs['deploy']['dependsOn'])
+            if kwargs['deploy'].__contains__('timeout'):
+                self.timeout['deploy'] = kwargs['deploy']['timeout']
         else:
             self.capability['deploy'] = None
         if kwargs['release'] is not None:  
-            self.capability['release'] = list(map(lambda x: Solution(variables, **x), kwargs['release']['solutions']))
+            self.capability['release'] = list(map(lambda x: Solution(variables, capability='release', **x), kwargs['release']['solutions']))
             if kwargs['release'].__contains__('dependsOn'):
                 self.__reorder('release', kwargs['release']['dependsOn'])
+            if kwargs['release'].__contains__('timeout'):
+                self.timeout['release'] = kwargs['release']['timeout']
         else:
             self.capability['release'] = None
         if kwargs['operate'] is not None:
-            self.capability['operate'] = list(map(lambda x: Solution(variables, **x), kwargs['operate']['solutions']))
+            self.capability['operate'] = list(map(lambda x: Solution(variables, capability='operate', **x), kwargs['operate']['solutions']))
             if kwargs['operate'].__contains__('dependsOn'):
                 self.__reorder('operate', kwargs['operate']['dependsOn'])
+            if kwargs['operate'].__contains__('timeout'):
+                self.timeout['operate'] = kwargs['operate']['timeout']
         else:
             self.capability['operate'] = None
         if kwargs['monitor'] is not None:
-            self.capability['monitor'] = list(map(lambda x: Solution(variables, **x), kwargs['monitor']['solutions']))
+            self.capability['monitor'] = list(map(lambda x: Solution(variables, capability='monitor', **x), kwargs['monitor']['solutions']))
             if kwargs['monitor'].__contains__('dependsOn'):
                 self.__reorder('monitor', kwargs['monitor']['dependsOn'])
+            if kwargs['monitor'].__contains__('timeout'):
+                self.timeout['monitor'] = kwargs['monitor']['timeout']
         else:
             self.capability['monitor'] = None
         if kwargs['plan'] is not None:
-            self.capability['plan'] = list(map(lambda x: Solution(variables, **x), kwargs['plan']['solutions']))
+            self.capability['plan'] = list(map(lambda x: Solution(variables, capability='plan', **x), kwargs['plan']['solutions']))
             if kwargs['plan'].__contains__('dependsOn'):
                 self.__reorder('plan', kwargs['plan']['dependsOn'])
+            if kwargs['plan'].__contains__('timeout'):
+                self.timeout['plan'] = kwargs['plan']['timeout']
         else:
             self.capability['plan'] = None
             
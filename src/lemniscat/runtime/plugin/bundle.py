@@ -0,0 +1,128 @@
+import hashlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+from logging import Logger
+from subprocess import CalledProcessError
+from typing import List, Optional
+from dacite import from_dict, ForwardReferenceError, UnexpectedDataError, WrongTypeError, MissingValueError
+from lemniscat.runtime.model.models import PluginConfig, DependencyModule
+from lemniscat.core.util import FileSystem
+
+_DEFAULT_BUNDLE_DIR = os.path.join('~', '.lemniscat', 'bundles')
+
+class PluginBundle:
+    """A relocatable site-packages snapshot of the plugins of a manifest and of their requirements,
+    keyed by a hash of both requirement sets, so cold agents can load plugins without pip nor network.
+    A snapshot is found by the key of the manifest requirements, the prefix of its directory"""
+    _logger: Logger
+    directory: str
+
+    def __init__(self, logger: Logger, directory: Optional[str] = None) -> None:
+        self._logger = logger
+        if(directory is None):
+            directory = os.environ.get('LEM_BUNDLE_DIR', _DEFAULT_BUNDLE_DIR)
+        self.directory = os.path.expanduser(directory)
+
+    @staticmethod
+    def __hash(requirements: List[DependencyModule]) -> str:
+        content = '\n'.join(sorted(str(requirement) for requirement in requirements))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def key(requirements: List[DependencyModule], pluginRequirements: List[DependencyModule] = None) -> str:
+        """Hash of the manifest requirements and of the interpreter the snapshot is built for, followed by
+        the hash of the requirements of the plugins when they are known"""
+        interpreter = f'{platform.python_implementation()}-{sys.version_info[0]}.{sys.version_info[1]}-{sys.platform}-{platform.machine()}'
+        key = PluginBundle.__hash(list(requirements) + [interpreter])
+        if(pluginRequirements is None):
+            return key
+        return f'{key}-{PluginBundle.__hash(pluginRequirements)}'
+
+    def path(self, requirements: List[DependencyModule]) -> Optional[str]:
+        """Return the most recent snapshot built for the manifest requirements, None when there is none"""
+        prefix = f'{self.key(requirements)}-'
+        try:
+            candidates = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.startswith(prefix) and not name.endswith('.tmp')]
+        except FileNotFoundError:
+            return None
+        candidates = [candidate for candidate in candidates if os.path.exists(os.path.join(candidate, 'bundle.json'))]
+        return max(candidates, key=os.path.getmtime, default=None)
+
+    def __pip_install(self, target: str, requirements: List[DependencyModule], dependencies: bool = True) -> None:
+        if(len(requirements) == 0):
+            return
+        python = sys.executable
+        # the index is left to pip: $PIP_INDEX_URL or the pip configuration of the agent (e.g. a private mirror)
+        subprocess.check_call(
+            [python, '-m', 'pip', 'install', '--target', target, '--no-input', '--disable-pip-version-check']
+            + ([] if dependencies else ['--no-deps'])
+            + [requirement.__str__() for requirement in requirements],
+            stdout=subprocess.DEVNULL
+        )
+
+    def __read_configuration(self, sitePackages: str, requirement: DependencyModule) -> Optional[PluginConfig]:
+        directory = os.path.join(sitePackages, *requirement.name.split('.'))
+        try:
+            plugin_config_data = FileSystem.load_configuration('plugin.yaml', directory)
+            return from_dict(data_class=PluginConfig, data=plugin_config_data)
+        except FileNotFoundError:
+            self._logger.warning(f'No configuration file exists for module: {requirement.name}')
+        except (NameError, ForwardReferenceError, UnexpectedDataError, WrongTypeError, MissingValueError) as e:
+            self._logger.error(f'Unable to parse plugin configuration of {requirement.name} to data class: {e}')
+        return None
+
+    def create(self, requirements: List[DependencyModule], force: bool = False) -> str:
+        """Install the plugins and the requirements of their plugin.yaml into a new snapshot"""
+        existing = self.path(requirements)
+        if(existing is not None and not force):
+            self._logger.info(f'Bundle already exists: {existing}')
+            return existing
+        building = os.path.join(self.directory, f'{self.key(requirements)}.{os.getpid()}.tmp')
+        sitePackages = os.path.join(building, 'site-packages')
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        try:
+            # the plugins alone are fetched first to read the requirements of their plugin.yaml
+            plugins = os.path.join(building, 'plugins')
+            self.__pip_install(plugins, requirements, dependencies=False)
+            pluginRequirements = []
+            for requirement in requirements:
+                config = self.__read_configuration(plugins, requirement)
+                if(config is not None and config.requirements is not None):
+                    pluginRequirements.extend([item for item in config.requirements if not item in pluginRequirements])
+            shutil.rmtree(plugins, ignore_errors=True)
+            # then everything is resolved together by a single pip call into an empty directory
+            self._logger.info(f'Installing {len(requirements)} plugins and {len(pluginRequirements)} requirements into: {building}')
+            os.makedirs(sitePackages)
+            self.__pip_install(sitePackages, requirements + pluginRequirements)
+            with open(os.path.join(building, 'bundle.json'), 'w') as f:
+                json.dump({
+                    'requirements': [str(requirement) for requirement in requirements],
+                    'pluginRequirements': [str(requirement) for requirement in pluginRequirements],
+                    'python': sys.version
+                }, f, indent=2)
+            target = os.path.join(self.directory, self.key(requirements, pluginRequirements))
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(building, target)
+        except (CalledProcessError, OSError):
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+        return target
+
+    def activate(self, requirements: List[DependencyModule]) -> bool:
+        """Put the matching snapshot, if any, first on the import path"""
+        target = self.path(requirements)
+        if(target is None):
+            self._logger.debug(f'No bundle found for the requirements in: {self.directory}')
+            return False
+        sitePackages = os.path.join(target, 'site-packages')
+        if(not sitePackages in sys.path):
+            sys.path.insert(0, sitePackages)
+            importlib.invalidate_caches()
+        self._logger.info(f'Plugins loaded from bundle: {target}')
+        return True
@@ -1,5 +1,6 @@
 import os
 import importlib
+import time
 from logging import Logger
 from typing import List, Any, Dict
 
@@ -9,18 +10,25 @@ from lemniscat.core.contract import IPluginRegistry, PluginCore
 from lemniscat.runtime.model.models import DependencyModule
 from lemniscat.core.util.helpers import FileSystem, LogUtil
 from .utilities import PluginUtility
+from .bundle import PluginBundle
 
 
 class PluginManager:
     _logger: Logger
     modules: dict
+    timings: List[tuple]
     _plugins: List[DependencyModule]
 
     def __init__(self, options: Dict) -> None:
         self._logger = LogUtil.create(options['verbosity'])
-        self._plugins = self.__read_pluginDependencies(options['manifest'])
-        self.plugin_util = PluginUtility(self._logger)
+        if(options.get('requirements') is not None):
+            self._plugins = [from_dict(data_class=DependencyModule, data=requirement) for requirement in options['requirements']]
+        else:
+            self._plugins = self.__read_pluginDependencies(options['manifest'])
+        bundle = PluginBundle(self._logger, options.get('bundleDir'))
+        self.plugin_util = PluginUtility(self._logger, offline=bundle.activate(self._plugins))
         self.modules = {}
+        self.timings = []
 
     
     def __read_pluginDependencies(self, manifest_path) -> List[str]:
@@ -38,12 +46,15 @@ class PluginManager:
 
     def __search_for_plugins_in(self, plugins: List[DependencyModule]):
         for plugin in plugins:
+            started = time.perf_counter()
             entry_point = self.plugin_util.setup_plugin_configuration(plugin)
             if entry_point is not None:
                 self.modules[entry_point.alias] = IPluginRegistry.plugin_registries[-1]
                 self._logger.debug(f'Plugin {plugin.name} gracefully loaded')
+                self.timings.append((plugin.name, 'Finished', time.perf_counter() - started))
             else:
                 self._logger.debug(f'No valid plugin found in {plugin.name}')
+                self.timings.append((plugin.name, 'Failed', time.perf_counter() - started))
 
     def discover_plugins(self, reload: bool):
         """
@@ -52,10 +63,15 @@ class PluginManager:
         """
         if reload:
             self.modules.clear()
+            self.timings.clear()
             IPluginRegistry.plugin_registries.clear()
             self._logger.debug(f'Searching for plugins...')
             self.__search_for_plugins_in(self._plugins)
     
+    @property
+    def requirements(self) -> List[dict]:
+        return [{ 'name': plugin.name, 'version': plugin.version } for plugin in self._plugins]
+
     def register_plugin_by_alias(self, alias: str) -> PluginCore:
         """
         Return a plugin instance by name.
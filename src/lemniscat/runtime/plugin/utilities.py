@@ -16,9 +16,10 @@ from lemniscat.core.util import FileSystem
 class PluginUtility:
     __IGNORE_LIST = ['__pycache__']
 
-    def __init__(self, logger: Logger) -> None:
+    def __init__(self, logger: Logger, offline: bool = False) -> None:
         super().__init__()
         self._logger = logger
+        self._offline = offline
 
     @staticmethod
     def __filter_unwanted_directories(name: str) -> bool:
@@ -52,6 +53,9 @@ class PluginUtility:
         return missing
 
     def __manage_requirements(self, package_name: str, requirements: List[DependencyModule]):
+        if self._offline:
+            # requirements are provided by an activated bundle
+            return
         installed_packages: List[Distribution] = list(
             filter(lambda pkg: isinstance(pkg, Distribution), pkg_resources.working_set)
         )
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import pytest
+from lemniscat.runtime.model.models import DependencyModule
+from lemniscat.runtime.plugin.bundle import PluginBundle
+
+REQUIREMENTS = [DependencyModule('lemniscat.plugin.echo', '0.0.1')]
+PLUGIN_YAML = """
+name: echo
+alias: echo
+creator: tests
+runtime:
+  main: echo
+repository: none
+description: echo
+version: 0.0.1
+parameters: []
+requirements:
+  - name: requests
+    version: 2.0.0
+"""
+
+@pytest.fixture
+def bundles(tmp_path):
+    return PluginBundle(logging.getLogger('tests'), str(tmp_path))
+
+def snapshot(bundles: PluginBundle, name: str, mtime: int, complete: bool = True) -> str:
+    path = os.path.join(bundles.directory, name)
+    os.makedirs(os.path.join(path, 'site-packages'))
+    if(complete):
+        with open(os.path.join(path, 'bundle.json'), 'w') as f:
+            json.dump({}, f)
+    os.utime(path, (mtime, mtime))
+    return path
+
+def test_key_depends_on_the_requirements_only():
+    key = PluginBundle.key(REQUIREMENTS)
+    assert key != PluginBundle.key([DependencyModule('lemniscat.plugin.echo', '0.0.2')])
+    assert PluginBundle.key(REQUIREMENTS + [DependencyModule('a', '1')]) == PluginBundle.key([DependencyModule('a', '1')] + REQUIREMENTS)
+    full = PluginBundle.key(REQUIREMENTS, [DependencyModule('requests', '2.0.0')])
+    assert full.startswith(f'{key}-') and full != f'{key}-{key}'
+
+def test_path_is_the_most_recent_complete_snapshot(bundles):
+    key = PluginBundle.key(REQUIREMENTS)
+    assert bundles.path(REQUIREMENTS) is None
+    older = snapshot(bundles, f'{key}-aaaa', 1000)
+    newer = snapshot(bundles, f'{key}-bbbb', 2000)
+    snapshot(bundles, f'{key}-cccc', 3000, complete=False)
+    snapshot(bundles, f'{key}.123.tmp', 4000)
+    snapshot(bundles, f'{PluginBundle.key([DependencyModule("other", "1")])}-dddd', 5000)
+    assert bundles.path(REQUIREMENTS) == newer
+    os.utime(older, (6000, 6000))
+    assert bundles.path(REQUIREMENTS) == older
+
+def test_missing_directory_has_no_snapshot(tmp_path):
+    assert PluginBundle(logging.getLogger('tests'), str(tmp_path / 'none')).path(REQUIREMENTS) is None
+
+def test_activate_puts_the_snapshot_first_once(bundles, monkeypatch):
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    assert not bundles.activate(REQUIREMENTS)
+    path = snapshot(bundles, f'{PluginBundle.key(REQUIREMENTS)}-aaaa', 1000)
+    assert bundles.activate(REQUIREMENTS)
+    assert bundles.activate(REQUIREMENTS)
+    assert sys.path[0] == os.path.join(path, 'site-packages')
+    assert sys.path.count(sys.path[0]) == 1
+
+def test_create_leaves_the_index_to_pip(bundles, monkeypatch):
+    calls = []
+    def pip(command, **kwargs):
+        calls.append(command)
+        target = command[command.index('--target') + 1]
+        if('--no-deps' in command):
+            os.makedirs(os.path.join(target, 'lemniscat', 'plugin', 'echo'))
+            with open(os.path.join(target, 'lemniscat', 'plugin', 'echo', 'plugin.yaml'), 'w') as f:
+                f.write(PLUGIN_YAML)
+    monkeypatch.setattr(subprocess, 'check_call', pip)
+    target = bundles.create(REQUIREMENTS)
+    assert os.path.basename(target) == PluginBundle.key(REQUIREMENTS, [DependencyModule('requests', '2.0.0')])
+    assert bundles.path(REQUIREMENTS) == target
+    assert calls[1][-2:] == ['lemniscat.plugin.echo==0.0.1', 'requests==2.0.0']
+    assert not any(argument.startswith('--index-url') or argument.startswith('--extra-index-url') for command in calls for argument in command)
+    # an existing snapshot is reused unless forced
+    assert bundles.create(REQUIREMENTS) == target and len(calls) == 2
+
+def test_failed_create_leaves_no_snapshot(bundles, monkeypatch):
+    def pip(command, **kwargs):
+        raise subprocess.CalledProcessError(1, command)
+    monkeypatch.setattr(subprocess, 'check_call', pip)
+    with pytest.raises(subprocess.CalledProcessError):
+        bundles.create(REQUIREMENTS)
+    assert os.listdir(bundles.directory) == []
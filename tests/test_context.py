@@ -0,0 +1,94 @@
+import logging
+import os
+import sys
+import pytest
+from lemniscat.core.model.models import VariableValue
+from lemniscat.runtime import lem
+from lemniscat.runtime.engine.engine_context import BinaryContext, write_binary_context
+from lemniscat.runtime.engine.engine_output import OutputContextWriter, write_context
+from lemniscat.runtime.engine.engine_variables import BagOfVariables
+
+def read(path: str) -> dict:
+    context = BinaryContext(path)
+    try:
+        return { key: (variable.value, variable.sensitive) for key, variable in context.items() }
+    finally:
+        context.close()
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / 'output.lemctx')
+    count = write_binary_context(path, [('b', VariableValue('x')), ('a', VariableValue({ 'k': [1, 2] })), ('secret', VariableValue('s', True))])
+    assert count == 3
+    assert read(path) == { 'a': ({ 'k': [1, 2] }, False), 'b': ('x', False), 'secret': ('s', True) }
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    context = BinaryContext(path)
+    assert 'b' in context and 'c' not in context
+    assert context.get('secret').value == 's'
+    assert context.get('c') is None
+    context.close()
+
+def test_not_a_context(tmp_path):
+    path = tmp_path / 'other.lemctx'
+    path.write_bytes(b'{"a": 1}' * 10)
+    with pytest.raises(ValueError):
+        BinaryContext(str(path))
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    class Unprintable:
+        def __str__(self):
+            raise RuntimeError('unprintable')
+    with pytest.raises(RuntimeError):
+        write_binary_context(str(tmp_path / 'output.lemctx'), [('a', VariableValue(Unprintable()))])
+    assert os.listdir(tmp_path) == []
+
+def died(path: str, variables: dict) -> None:
+    """Leave the journal of a run which died before writing its context"""
+    writer = OutputContextWriter(logging.getLogger('tests'), path)
+    writer.append(variables)
+    writer.close()
+
+@pytest.mark.parametrize('store', ['memory', 'sqlite'])
+def test_context_feeds_the_next_run(tmp_path, store):
+    path = str(tmp_path / 'previous.lemctx')
+    write_binary_context(path, [('greeting', VariableValue('hello')), ('message', VariableValue('${{ greeting }}'))])
+    bag = BagOfVariables(logging.getLogger('tests'), { 'configFiles': repr([path]), 'manifest': None, 'extraVariables': '{}', 'variableStore': store })
+    bag.interpret()
+    # the values of a context are already interpreted: they are never rendered again
+    assert bag._variables['message'].value == '${{ greeting }}'
+    assert bag._variables['greeting'].value == 'hello'
+    bag.close()
+
+@pytest.mark.parametrize('store', ['memory', 'sqlite'])
+def test_journal_of_a_died_run_feeds_the_next_run(tmp_path, store):
+    path = str(tmp_path / 'previous.lemctx')
+    died(path, { 'greeting': VariableValue('hello'), 'message': VariableValue('${{ greeting }}'), 'token': VariableValue('s', True) })
+    assert not os.path.exists(path)
+    bag = BagOfVariables(logging.getLogger('tests'), { 'configFiles': repr([path]), 'manifest': None, 'extraVariables': '{}', 'variableStore': store })
+    bag.interpret()
+    assert bag._variables['message'].value == '${{ greeting }}'
+    assert bag._variables['greeting'].value == 'hello'
+    # sensitive variables are never journaled
+    assert not 'token' in bag._variables
+    bag.close()
+
+def test_merge(tmp_path, monkeypatch):
+    first = str(tmp_path / 'shard1.lemctx')
+    second = str(tmp_path / 'shard2.json')
+    merged = str(tmp_path / 'merged.lemctx')
+    write_binary_context(first, [('build', VariableValue('ok')), ('token', VariableValue('s', True))])
+    write_context(second, [('test', VariableValue('ok'))])
+    monkeypatch.setattr(sys, 'argv', ['lem', 'merge', first, second, '-o', merged, '-v', 'ERROR'])
+    lem()
+    assert read(merged) == { 'build': ('ok', False), 'test': ('ok', False), 'token': ('s', True) }
+
+def test_merge_replays_the_journal_of_a_died_shard(tmp_path, monkeypatch):
+    first = str(tmp_path / 'shard1.lemctx')
+    second = str(tmp_path / 'shard2.lemctx')
+    merged = str(tmp_path / 'merged.lemctx')
+    # the journal is newer than the context an earlier run left
+    write_binary_context(first, [('build', VariableValue('old')), ('stale', VariableValue('x'))])
+    died(first, { 'build': VariableValue('ok'), 'count': VariableValue(2) })
+    write_binary_context(second, [('test', VariableValue('ok'))])
+    monkeypatch.setattr(sys, 'argv', ['lem', 'merge', first, second, '-o', merged, '-v', 'ERROR'])
+    lem()
+    assert read(merged) == { 'build': ('ok', False), 'count': (2, False), 'test': ('ok', False) }
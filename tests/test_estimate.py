@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+from lemniscat.runtime.engine.engine_estimate import Estimator
+from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+
+ORDER = ['code', 'build', 'test', 'deploy', 'release', 'operate', 'monitor', 'plan']
+# the order the engine runs the capabilities in, see `Capabilities.predecessors`
+SEQUENTIAL = { capability: ORDER[index - 1:index] for index, capability in enumerate(ORDER) }
+
+MANIFEST = """
+variables:
+  - name: build_enable
+    value: true
+  - name: build_solution
+    value: dotnet
+  - name: test_enable
+    value: false
+  - name: test_solution
+    value: pytest
+  - name: deploy_enable
+    value: true
+  - name: deploy_solution
+    value: azure
+capabilities:
+  code: null
+  build:
+    solutions:
+      - solution: dotnet
+        tasks:
+          - task: echo
+            displayName: compile
+            steps: [run]
+            parameters: {}
+          - task: echo
+            displayName: never
+            steps: [run]
+            condition: 1 == 2
+            parameters: {}
+  test:
+    solutions:
+      - solution: pytest
+        tasks:
+          - task: echo
+            displayName: tests
+            steps: [run]
+            parameters: {}
+  deploy:
+    solutions:
+      - solution: azure
+        tasks:
+          - task: echo
+            displayName: deploy
+            steps: [run]
+            condition: ${{ built }} == 'yes'
+            parameters: {}
+  release: null
+  operate: null
+  monitor: null
+  plan: null
+"""
+
+def item(capability, name='echo', solution='main', condition=None):
+    return { 'capability': capability, 'solution': solution, 'step': 'run', 'task': SimpleNamespace(displayName=name, condition=condition) }
+
+def history(capability, duration, name='echo', solution='main', status='Finished'):
+    return { 'kind': 'task', 'capability': capability, 'solution': solution, 'step': 'run', 'name': name, 'status': status, 'duration': duration }
+
+def test_estimate_from_successful_runs():
+    records = [history('build', 2), history('build', 4), history('build', 60, status='Failed')]
+    estimate = Estimator([item('build'), item('build', name='unknown', condition="'a' == 'a'")], records, SEQUENTIAL)
+    known, unknown = estimate.tasks
+    assert (known['samples'], known['mean']) == (2, 3)
+    assert (unknown['samples'], unknown['mean'], unknown['conditional']) == (0, None, True)
+    assert (estimate.total, estimate.unknown) == (3, 1)
+
+def test_critical_path_walks_through_disabled_capabilities():
+    # test has no planned task but deploy still waits for build through it
+    records = [history('build', 3), history('deploy', 2)]
+    estimate = Estimator([item('build'), item('deploy')], records, SEQUENTIAL)
+    assert estimate.criticalPath == ['build', 'deploy']
+    assert estimate.criticalDuration == 5
+
+def test_critical_path_follows_the_longest_branch():
+    # with dependsOn test and deploy both only wait for build
+    predecessors = dict(SEQUENTIAL, test=['build'], deploy=['build'])
+    records = [history('build', 1), history('test', 5), history('deploy', 2)]
+    estimate = Estimator([item('build'), item('test'), item('deploy')], records, predecessors)
+    assert estimate.criticalPath == ['build', 'test']
+    assert estimate.criticalDuration == 6
+
+def test_critical_path_ties_prefer_the_last_capability():
+    predecessors = dict(SEQUENTIAL, test=['build'], deploy=['build'])
+    records = [history('build', 1), history('test', 2), history('deploy', 2)]
+    estimate = Estimator([item('build'), item('test'), item('deploy')], records, predecessors)
+    assert estimate.criticalPath == ['build', 'deploy']
+    # a tie between predecessors keeps the first one
+    predecessors = dict(SEQUENTIAL, deploy=['build', 'test'], test=['code'])
+    records = [history('build', 2), history('test', 2), history('deploy', 1)]
+    estimate = Estimator([item('build'), item('test'), item('deploy')], records, predecessors)
+    assert estimate.criticalPath == ['build', 'deploy']
+
+def test_critical_path_is_framed_by_pre_and_post():
+    plan = [item('global', solution='pre'), item('build'), item('global', solution='post')]
+    records = [history('global', 1, solution='pre'), history('build', 3), history('global', 0.5, solution='post')]
+    estimate = Estimator(plan, records, SEQUENTIAL)
+    assert estimate.criticalPath == ['pre', 'build', 'post']
+    assert estimate.criticalDuration == 4.5
+    assert Estimator([item('global', solution='post')], [], SEQUENTIAL).criticalPath == ['post']
+    assert 'Critical path: pre -> build -> post (4.50s)' in estimate.to_text()
+
+def test_plan_keeps_tasks_whose_condition_needs_runtime_variables(tmp_path):
+    manifest = tmp_path / 'manifest.yaml'
+    manifest.write_text(MANIFEST)
+    engine = OrchestratorEngine(options={
+        'manifest': str(manifest),
+        'verbosity': 'ERROR',
+        'steps': '["run:all"]',
+        'configFiles': '[]',
+        'extraVariables': '{}',
+        'outputContext': None,
+        'variableStore': None,
+        'shard': None
+    }, plugins=object())
+    try:
+        planned = engine.plan()
+    finally:
+        engine.close()
+    # `never` is false at plan time, test is disabled, `built` is only known once build ran
+    assert [(task['capability'], task['task'].displayName) for task in planned] == [('build', 'compile'), ('deploy', 'deploy')]
@@ -0,0 +1,64 @@
+import logging
+import pytest
+from lemniscat.runtime.engine.engine_metrics import MetricsReport, MetricsStore, RunRecorder, percentile
+
+def records(durations, status='Finished', name='echo', **fields):
+    return [dict({ 'manifest': '/m.yaml', 'kind': 'task', 'capability': 'build', 'solution': 'main', 'step': 'run', 'name': name,
+                   'status': status, 'duration': duration, 'timestamp': f'2024-01-01T00:00:{index:02d}' }, **fields)
+            for index, duration in enumerate(durations)]
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([4.0], 90) == 4.0
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([4, 1, 3, 2], 90) == pytest.approx(3.7)
+    assert percentile([1, 2, 3, 4], 100) == 4
+
+def test_regression_needs_a_baseline_a_ratio_and_a_delta():
+    assert MetricsReport(records([1, 1, 1, 2])).regressions != []
+    # fewer than 3 previous samples
+    assert MetricsReport(records([1, 1, 2])).regressions == []
+    # slower than the threshold but by less than minDelta
+    assert MetricsReport(records([1, 1, 1, 1.4])).regressions == []
+    assert MetricsReport(records([1, 1, 1, 1.4]), minDelta=0.1).regressions != []
+    # within the threshold
+    assert MetricsReport(records([1, 1, 1, 2]), threshold=2.5).regressions == []
+
+def test_regression_baseline_is_the_window_of_successful_runs():
+    durations = [5, 5, 5, 1, 1, 1, 2]
+    assert MetricsReport(records(durations)).rows[0]['baseline'] == 3
+    assert MetricsReport(records(durations), window=3).rows[0]['baseline'] == 1
+    assert MetricsReport(records(durations), window=3).regressions != []
+    failed = records([1, 1, 1]) + records([9], status='Failed')
+    assert MetricsReport(failed).regressions == []
+
+def test_report_groups_and_counts():
+    report = MetricsReport(records([1, 3]) + records([2], status='Failed') + records([7], name='other'))
+    echo, other = report.rows
+    assert (echo['name'], echo['count'], echo['failures'], echo['samples'], echo['p50']) == ('echo', 3, 1, 2, 2)
+    assert (other['name'], other['count']) == ('other', 1)
+
+def test_openmetrics_escapes_labels_and_ends_with_eof():
+    text = MetricsReport(records([1, 2], name='say "hi"\\ \nnow')).to_openmetrics()
+    assert 'name="say \\"hi\\"\\\\ \\nnow"' in text
+    assert 'quantile="0.95"' in text
+    assert 'lemniscat_duration_seconds_count{' in text
+    assert text.endswith('# EOF\n')
+
+def test_recording_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv('LEM_METRICS_STORE', raising=False)
+    assert MetricsStore.from_option(None) is None
+    assert MetricsStore.from_option('none') is None
+    assert MetricsStore.from_option(None, record=False) is not None
+    monkeypatch.setenv('LEM_METRICS_STORE', str(tmp_path / 'metrics.jsonl'))
+    assert MetricsStore.from_option(None).path == str(tmp_path / 'metrics.jsonl')
+
+def test_recorder_appends_to_one_handle(tmp_path):
+    store = MetricsStore(str(tmp_path / 'metrics.jsonl'))
+    recorder = RunRecorder(logging.getLogger('tests'), store, None)
+    recorder.record('task', 'echo', 'Finished', 0.5)
+    recorder.record('task', 'echo', 'Finished', 0.7)
+    recorder.close()
+    read = store.read()
+    assert [record['duration'] for record in read] == [0.5, 0.7]
+    assert read[0]['manifest'] is None
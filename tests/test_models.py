@@ -0,0 +1,55 @@
+import json
+from lemniscat.runtime.model.models import STEPS, Phase, Solution, Task, TaskStatus, shared_tree, steps_mask
+
+def task(name: str, steps: list, parameters: dict = None, **fields) -> dict:
+    return dict({ 'task': name, 'displayName': name, 'steps': steps, 'parameters': parameters or {} }, **fields)
+
+def test_steps_mask():
+    assert steps_mask([]) == steps_mask(None) == 0
+    assert steps_mask(['pre']) == 1
+    assert steps_mask(['run', 'pre', 'run']) == steps_mask(['pre', 'run'])
+    assert steps_mask(['unknown']) == 0
+    assert steps_mask(STEPS) == (1 << len(STEPS)) - 1
+
+def test_task_steps_keep_the_engine_order():
+    assert Task(**task('echo', ['post-clean', 'run', 'unknown'])).steps == ['run', 'post-clean']
+
+def test_shared_tree_stores_equal_trees_once():
+    trees = {}
+    first = shared_tree({ 'a': [1, { 'b': 'c' }] }, trees)
+    assert shared_tree({ 'a': [1, { 'b': 'c' }] }, trees) is first
+    assert shared_tree({ 'a': [1, { 'b': 'd' }] }, trees) is not first
+    assert shared_tree('scalar', trees) == 'scalar'
+
+def test_shared_tree_without_trees_or_json():
+    value = { 'a': { 1, 2 } }
+    assert shared_tree(value, {}) == value
+    assert shared_tree(value) == value and shared_tree(value) is not value
+
+def test_shared_parameters_are_not_mutated_through_a_task():
+    solution = Solution({}, solution='main', capability='build', tasks=[task('first', ['run'], { 'files': ['a'], 'options': { 'x': 1 } }),
+                                                                        task('second', ['run'], { 'files': ['a'], 'options': { 'x': 1 } })])
+    first, second = solution.tasks
+    assert first._parameters is second._parameters
+    parameters = first.parameters
+    parameters['files'].append('b')
+    parameters['options']['x'] = 2
+    assert first.parameters == second.parameters == { 'files': ['a'], 'options': { 'x': 1 } }
+
+def test_task_status_compares_to_its_name():
+    assert TaskStatus.FAILED == 'Failed' and 'Pending' == TaskStatus.PENDING
+    assert str(TaskStatus.FINISHED) == f'{TaskStatus.FINISHED}' == 'Finished'
+    assert json.dumps({ 'status': TaskStatus.RUNNING }) == '{"status": "Running"}'
+    assert TaskStatus('Failed') is TaskStatus.FAILED
+    assert 'Failed' in [TaskStatus.FAILED]
+
+def test_tasks_by_step_matches_the_list_filter():
+    tasks = [task('pre', ['pre']), task('run', ['run']), task('both', ['run', 'post']), task('clean', ['run-clean', 'post-clean']),
+             task('done', ['run', 'post']), task('none', [])]
+    for holder in [Solution({}, solution='main', capability='build', tasks=tasks), Phase({}, name='pre', tasks=tasks)]:
+        holder.tasks[4].status = TaskStatus.FINISHED
+        for step in STEPS + ['unknown']:
+            expected = [item for item in holder.tasks if step in item.steps and item.status == 'Pending']
+            assert holder.tasks_byStep(step) == expected
+        assert [item.name for item in holder.run_tasks()] == ['run', 'both']
+        assert [item.name for item in holder.postclean_tasks()] == ['clean']
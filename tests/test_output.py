@@ -0,0 +1,61 @@
+import datetime
+import json
+import logging
+import os
+import pytest
+from lemniscat.core.model.models import VariableValue
+from lemniscat.runtime.engine.engine_output import OutputContextReader, OutputContextWriter, write_context
+
+_LOGGER = logging.getLogger('tests')
+
+def test_context_is_read_through_its_index(tmp_path):
+    path = str(tmp_path / 'output.json')
+    count = write_context(path, [('a', VariableValue('1')), ('b', VariableValue({ 'k': [1, 2] })), ('secret', VariableValue('x', True))])
+    assert count == 2
+    with open(path) as f:
+        assert json.load(f) == { 'a': '1', 'b': { 'k': [1, 2] } }
+    reader = OutputContextReader(path)
+    assert reader.indexed
+    assert reader.get('b') == { 'k': [1, 2] }
+    assert reader.load(['a']) == { 'a': '1' }
+
+def test_journal_is_replayed_when_the_run_died(tmp_path):
+    path = str(tmp_path / 'output.json')
+    writer = OutputContextWriter(_LOGGER, path)
+    writer.append({ 'a': VariableValue('1'), 'secret': VariableValue('x', True) })
+    writer.append({ 'a': VariableValue('2'), 'b': VariableValue([1]) })
+    writer.close()
+    with open(f'{path}.jsonl', 'a') as f:
+        f.write('{"key": "trunc')
+    assert OutputContextReader(path).load() == { 'a': '2', 'b': [1] }
+
+def test_compaction_drops_the_journal(tmp_path):
+    path = str(tmp_path / 'output.json')
+    writer = OutputContextWriter(_LOGGER, path)
+    writer.append({ 'a': VariableValue('1') })
+    writer.compact([('a', VariableValue('1')), ('day', VariableValue(datetime.date(2024, 1, 2)))])
+    assert not os.path.exists(f'{path}.jsonl')
+    assert OutputContextReader(path).load() == { 'a': '1', 'day': '2024-01-02' }
+
+def test_journal_of_a_previous_run_is_truncated(tmp_path):
+    path = str(tmp_path / 'output.json')
+    write_context(path, [('old', VariableValue('compacted'))])
+    with open(f'{path}.jsonl', 'w') as f:
+        f.write('{"key": "stale", "value": 1}\n')
+    OutputContextWriter(_LOGGER, path).close()
+    assert OutputContextReader(path).load() == {}
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    class Unprintable:
+        def __str__(self):
+            raise RuntimeError('unprintable')
+    with pytest.raises(RuntimeError):
+        write_context(str(tmp_path / 'output.json'), [('a', VariableValue(Unprintable()))])
+    assert os.listdir(tmp_path) == []
+
+def test_failed_open_raises_its_own_error(tmp_path, monkeypatch):
+    def denied(*args, **kwargs):
+        raise PermissionError('denied')
+    monkeypatch.setattr('builtins.open', denied)
+    with pytest.raises(PermissionError):
+        write_context(str(tmp_path / 'output.json'), [('a', VariableValue('1'))])
@@ -0,0 +1,97 @@
+import pytest
+import yaml
+from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+from lemniscat.runtime.engine.engine_shard import Sharding, groups, parse_shard
+from lemniscat.runtime.model.models import Capabilities, Solution
+
+_CAPABILITIES = ['code', 'build', 'test', 'deploy', 'release', 'operate', 'monitor', 'plan']
+
+def manifest(**defined) -> dict:
+    capabilities = { capability: None for capability in _CAPABILITIES }
+    for capability, dependsOn in defined.items():
+        capabilities[capability] = { 'solutions': [{ 'solution': 'main', 'tasks': [
+            { 'task': 'echo', 'displayName': capability, 'steps': ['run'], 'parameters': {} }] }] }
+        if(dependsOn is not None):
+            capabilities[capability]['dependsOn'] = dependsOn
+    return capabilities
+
+def capabilities(**defined) -> Capabilities:
+    return Capabilities({}, **manifest(**defined))
+
+def partition(capabilities: Capabilities, count: int) -> list:
+    selected = [(capability, solution) for capability in capabilities.order for solution in capabilities.capability[capability] or []]
+    shards = []
+    for index in range(1, count + 1):
+        sharding = Sharding(index, count, capabilities.dependsOn)
+        sharding.assign(selected)
+        shards.append(sorted(capability for capability, solution in selected if sharding.owns(capability, solution)))
+    return shards
+
+def test_parse_shard():
+    assert parse_shard('2/3') == (2, 3)
+    for option in ['0/3', '4/3', '1/0', 'x', '1/2/3']:
+        with pytest.raises(ValueError):
+            parse_shard(option)
+
+def test_capabilities_without_dependsOn_are_not_grouped():
+    assert groups(capabilities(build=None, test=None, deploy=None).dependsOn) == {}
+
+def test_dependsOn_links_capabilities():
+    assert groups({ 'build': ['code'], 'test': [], 'deploy': ['test'], 'release': ['deploy'] }) == {
+        'build': 'build', 'code': 'build', 'deploy': 'deploy', 'test': 'deploy', 'release': 'deploy' }
+
+def test_manifest_is_split_across_shards():
+    # the capabilities wait for each other, but only a dependsOn keeps them together
+    assert sorted(partition(capabilities(build=None, test=None, deploy=None), 3)) == [['build'], ['deploy'], ['test']]
+    shards = partition(capabilities(build=None, test=None, deploy=['build']), 2)
+    assert sorted(shards) == [['build', 'deploy'], ['test']]
+
+def test_units_are_dealt_to_every_shard_once():
+    predecessors = { 'build': [], 'test': [], 'deploy': [] }
+    selected = [(capability, Solution({}, solution=f'solution{index}', capability=capability, tasks=[]))
+                for capability in predecessors for index in range(4)]
+    owners = []
+    for index in range(1, 4):
+        sharding = Sharding(index, 3, predecessors)
+        sharding.assign(selected)
+        owners.append([sharding.owns(capability, solution) for capability, solution in selected])
+    # every solution is owned by exactly one shard, and every shard gets some
+    assert all(sum(owned) == 1 for owned in zip(*owners))
+    assert all(any(owned) for owned in owners)
+
+def test_linked_capabilities_stay_on_the_same_shard():
+    predecessors = { 'build': [], 'test': ['build'], 'deploy': [] }
+    sharding = Sharding(1, 2, predecessors)
+    build = Solution({}, solution='main', capability='build', tasks=[])
+    test = Solution({}, solution='main', capability='test', tasks=[])
+    assert sharding.unit('build', build) == sharding.unit('test', test)
+    sharding.assign([('build', build), ('test', test)])
+    assert sharding.owns('build', build) == sharding.owns('test', test)
+
+def test_task_ids_are_stable_and_unique():
+    task = { 'task': 'echo', 'displayName': 'same', 'steps': ['run'], 'parameters': {} }
+    first = Solution({}, solution='main', capability='build', tasks=[task, dict(task)])
+    second = Solution({}, solution='main', capability='build', tasks=[task, dict(task)])
+    assert [task.id for task in first.tasks] == [task.id for task in second.tasks]
+    assert first.tasks[0].id != first.tasks[1].id
+
+def test_engine_plans_a_shard_of_the_manifest(tmp_path):
+    path = tmp_path / 'manifest.yaml'
+    variables = [{ 'name': f'{capability}_{field}', 'value': value } for capability in ['build', 'test', 'deploy'] for field, value in [('enable', True), ('solution', 'main')]]
+    path.write_text(yaml.safe_dump({ 'variables': variables, 'capabilities': manifest(build=None, test=None, deploy=None) }))
+    planned = []
+    for index in range(1, 4):
+        engine = OrchestratorEngine(options={
+            'manifest': str(path),
+            'verbosity': 'ERROR',
+            'steps': '["run:all"]',
+            'configFiles': '[]',
+            'extraVariables': '{}',
+            'outputContext': None,
+            'shard': f'{index}/3'
+        }, plugins=object())
+        try:
+            planned.append([item['capability'] for item in engine.plan()])
+        finally:
+            engine.close()
+    assert sorted(planned) == [['build'], ['deploy'], ['test']]
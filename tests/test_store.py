@@ -0,0 +1,160 @@
+import logging
+import sqlite3
+import pytest
+from lemniscat.core.model.models import VariableValue
+from lemniscat.core.util.helpers import Interpreter
+from lemniscat.runtime.engine.engine_context import BinaryContext, write_binary_context
+from lemniscat.runtime.engine.engine_store import SqliteVariableStore, StoredValue, VariableStore
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request):
+    store = VariableStore.create(request.param)
+    store.index('greeting', 'hello')
+    store.index('message', '${{ greeting }} world')
+    store.index('build.target', 'release')
+    store['name'] = VariableValue('lemniscat')
+    store.commit()
+    yield store
+    store.close()
+
+def test_indexed_values_are_materialized_when_read(store):
+    assert sorted(store.pending()) == ['build.target', 'greeting', 'message']
+    assert list(store) == ['name']
+    assert store['message'].value == 'hello world'
+    assert sorted(store) == ['greeting', 'message', 'name']
+    assert store.pending() == ['build.target']
+
+def test_peek_does_not_materialize(store):
+    assert store.peek('message').value == 'hello world'
+    assert 'message' in store.pending()
+
+def test_to_save_yields_every_variable(store):
+    assert { key: variable.value for key, variable in store.to_save() } == {
+        'greeting': 'hello', 'message': 'hello world', 'build.target': 'release', 'name': 'lemniscat' }
+
+def test_view_iterates_pending_and_scoped_variables(store):
+    view = store.for_capability('build')
+    assert sorted(view) == ['build.target', 'greeting', 'message', 'name', 'target']
+    assert len(view) == 5
+    assert { key: variable.value for key, variable in view.items() }['target'] == 'release'
+    assert view['message'].value == 'hello world'
+
+def test_view_keeps_only_changes_in_its_overlay(store):
+    view = store.for_capability('build')
+    view['name'] = VariableValue('lemniscat')
+    view['greeting'] = VariableValue('bonjour')
+    view['output'] = VariableValue('done')
+    assert sorted(view.overlay) == ['greeting', 'output']
+    assert 'output' not in store
+    store.update(view)
+    assert store['greeting'].value == 'bonjour'
+    assert store['output'].value == 'done'
+
+def test_view_does_not_materialize_what_a_plugin_reads(store):
+    pending = sorted(store.pending())
+    view = store.for_capability('build')
+    # what `PluginCore.invoke` does with the variables it is given
+    Interpreter(logging.getLogger('tests'), view).interpret()
+    assert view['message'].value == 'hello world'
+    assert view['target'].value == 'release'
+    assert sorted(store.pending()) == pending
+    assert view.overlay == {}
+    view['message'] = VariableValue('bye')
+    store.update(view)
+    assert sorted(store.pending()) == ['build.target', 'greeting']
+    assert store['message'].value == 'bye'
+
+def test_view_deletion_hides_a_variable(store):
+    view = store.for_capability('build')
+    del view['greeting']
+    assert 'greeting' not in view
+    assert 'greeting' not in list(view)
+    assert 'greeting' in store
+    with pytest.raises(KeyError):
+        view['greeting']
+
+def test_scoped_variables(store):
+    assert store.scoped('build') == { 'target': 'build.target' }
+    store['build.output'] = VariableValue('bin')
+    assert store.scoped('build') == { 'target': 'build.target', 'output': 'build.output' }
+
+def test_view_lists_the_store_once(store, monkeypatch):
+    view = store.for_capability('build')
+    list(view)
+    monkeypatch.setattr(type(store), 'pending', lambda self: pytest.fail('the store was listed again'))
+    view['output'] = VariableValue('done')
+    assert 'output' in list(view)
+
+def test_slice_leaves_out_the_other_capabilities(store):
+    store['deploy.region'] = VariableValue('west')
+    store['deployment'] = VariableValue('blue')
+    assert sorted(store.slice(['deploy'])) == ['deployment', 'name']
+    assert sorted(store.slice([])) == ['deploy.region', 'deployment', 'name']
+    assert store.slice(['build'], pending=True) == { 'greeting': 'hello', 'message': '${{ greeting }} world' }
+    assert sorted(store.slice(['deploy'], pending=True)) == ['build.target', 'greeting', 'message']
+    assert sorted(store.pending()) == ['build.target', 'greeting', 'message']
+
+def test_slice_decodes_the_context_variables(store, tmp_path):
+    path = str(tmp_path / 'previous.lemctx')
+    write_binary_context(path, [('build.token', VariableValue('s', True)), ('result', VariableValue('${{ name }}'))])
+    context = BinaryContext(path)
+    for position, key in enumerate(context.keys()):
+        store.stored(key, StoredValue(context, position))
+    variables = store.slice(['build'])
+    assert (variables['result'].value, 'build.token' in variables) == ('${{ name }}', False)
+    assert store.slice(['deploy'])['build.token'].sensitive
+    assert 'result' not in store.slice([], pending=True)
+    context.close()
+
+def test_interpret_leaves_the_context_variables(store, tmp_path):
+    path = str(tmp_path / 'previous.lemctx')
+    write_binary_context(path, [('result', VariableValue('${{ greeting }}'))])
+    context = BinaryContext(path)
+    for position, key in enumerate(context.keys()):
+        store.stored(key, StoredValue(context, position))
+    store['other'] = VariableValue('${{ name }}')
+    # decoded before the interpretation: still never rendered again
+    assert store['result'].value == '${{ greeting }}'
+    store.interpret(Interpreter(logging.getLogger('tests'), store))
+    assert (store['result'].value, store['other'].value) == ('${{ greeting }}', 'lemniscat')
+    context.close()
+
+def test_sqlite_slice_is_read_in_one_query(monkeypatch):
+    store = SqliteVariableStore()
+    for index in range(100):
+        store[f'deploy.key{index}'] = VariableValue(index)
+    store['name'] = VariableValue('lemniscat')
+    monkeypatch.setattr(SqliteVariableStore, '__getitem__', lambda self, key: pytest.fail('read key by key'))
+    assert { key: variable.value for key, variable in store.slice(['deploy']).items() } == { 'name': 'lemniscat' }
+    store.close()
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        VariableStore()
+
+def test_sqlite_database_is_reused_by_the_next_run(tmp_path):
+    path = str(tmp_path / 'variables.db')
+    for value in ['first', 'second']:
+        store = VariableStore.create(f'sqlite:{path}')
+        store['run'] = VariableValue(value)
+        store.close()
+    VariableStore.check(f'sqlite:{path}')
+
+def test_sqlite_refuses_a_foreign_database(tmp_path):
+    path = str(tmp_path / 'other.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE variables (owner TEXT)')
+    connection.execute("INSERT INTO variables VALUES ('someone else')")
+    connection.commit()
+    connection.close()
+    with pytest.raises(ValueError):
+        VariableStore.check(f'sqlite:{path}')
+    with pytest.raises(ValueError):
+        SqliteVariableStore(path)
+    connection = sqlite3.connect(path)
+    assert connection.execute('SELECT owner FROM variables').fetchall() == [('someone else',)]
+    connection.close()
+
+def test_unknown_store_is_refused():
+    with pytest.raises(ValueError):
+        VariableStore.check('redis')
@@ -0,0 +1,57 @@
+import copy
+import logging
+import pytest
+from lemniscat.core.model.models import VariableValue
+from lemniscat.core.util.helpers import Interpreter
+from lemniscat.runtime.engine.engine_template import CompiledTemplate
+
+_VARIABLES = {
+    'name': VariableValue('lemniscat'),
+    'count': VariableValue(3),
+    'enabled': VariableValue(True),
+    'settings': VariableValue({ 'region': 'westeurope' }),
+    'password': VariableValue('p@ss', True)
+}
+
+def interpreted(value: dict) -> VariableValue:
+    variables = copy.deepcopy(_VARIABLES)
+    variables['value'] = VariableValue(copy.deepcopy(value))
+    Interpreter(logging.getLogger('tests'), variables).interpret()
+    return variables['value']
+
+@pytest.mark.parametrize('value', [
+    { 'text': 'no expression' },
+    { 'text': '${{ name }}' },
+    { 'text': '${{name}}' },
+    { 'number': '${{ count }}' },
+    { 'flag': '${{ enabled }}' },
+    { 'tree': '${{ settings }}' },
+    { 'text': 'hello ${{ name }}, ${{ name }}!' },
+    { 'text': '${{ str(count) }}' },
+    { 'text': '${{ unknown }}' },
+    { 'text': 'hello ${{ unknown }}' },
+    { 'secret': 'user:${{ password }}' },
+    { 'nested': { 'deeper': { 'text': '${{ name }}-${{ str(count) }}' }, 'other': 1 } }
+])
+def test_render_matches_the_interpreter(value):
+    expected = interpreted(value)
+    rendered = CompiledTemplate(value).render(_VARIABLES)
+    assert (rendered.value, rendered.sensitive) == (expected.value, expected.sensitive)
+
+def test_render_keeps_the_compiled_tree_intact():
+    template = CompiledTemplate({ 'condition': "${{ name }} == 'x'", 'tasks': [{ 'text': '${{ name }}' }] }, excludeInterpret=['condition'])
+    first = template.render(_VARIABLES).value
+    first['tasks'][0]['text'] = 'changed'
+    assert template.render(_VARIABLES).value == { 'condition': "${{ name }} == 'x'", 'tasks': [{ 'text': 'lemniscat' }] }
+
+def test_excluded_key_does_not_stop_the_others():
+    # the interpreter stops at the first excluded key, the compiled template only skips it
+    value = { 'condition': '${{ name }}', 'text': '${{ name }}' }
+    assert CompiledTemplate(value, excludeInterpret=['condition']).render(_VARIABLES).value == { 'condition': '${{ name }}', 'text': 'lemniscat' }
+
+def test_strings_in_lists_are_rendered():
+    # the interpreter leaves the strings of a list as they are
+    assert CompiledTemplate({ 'items': ['${{ name }}', 'x'] }).render(_VARIABLES).value == { 'items': ['lemniscat', 'x'] }
+
+def test_references():
+    assert CompiledTemplate({ 'a': '${{ name }} ${{ str(count) }}', 'b': ['${{ settings }}'] }).references == ['name', 'count', 'settings']
@@ -0,0 +1,157 @@
+import logging
+from types import SimpleNamespace
+import pytest
+from lemniscat.core.model.models import TaskResult, VariableValue
+from lemniscat.runtime.engine.engine_runtime import OrchestratorEngine
+from lemniscat.runtime.engine.engine_store import VariableStore
+from lemniscat.runtime.engine.engine_variables import BagOfVariables
+from lemniscat.runtime.engine.engine_watch import IncrementalCache, templates
+
+MANIFEST = """
+variables:
+  - name: build_enable
+    value: true
+  - name: build_solution
+    value: dotnet
+  - name: deploy_enable
+    value: true
+  - name: deploy_solution
+    value: azure
+capabilities:
+  code: null
+  build:
+    solutions:
+      - solution: dotnet
+        tasks:
+          - task: build
+            displayName: compile
+            steps: [run]
+            parameters:
+              target: ${{ target }}
+  test: null
+  deploy:
+    solutions:
+      - solution: azure
+        tasks:
+          - task: deploy
+            displayName: deploy
+            steps: [run]
+            condition: ${{ built }} != ''
+            parameters:
+              artifact: ${{ built }}
+  release: null
+  operate: null
+  monitor: null
+  plan: null
+"""
+
+class Plugins:
+    """Plugins recording their calls: `build` outputs the artifact of its target"""
+
+    def __init__(self) -> None:
+        self.calls = []
+        self._variables = {}
+
+    def register_plugin_by_alias(self, name: str) -> str:
+        return name
+
+    def hook_invoke(self, plugin: str):
+        def invoke(parameters: dict, variables: dict) -> TaskResult:
+            self.calls.append(plugin)
+            if(plugin == 'build'):
+                variables['built'] = VariableValue(f"{parameters['target']}.zip")
+            self._variables[plugin] = variables
+            return TaskResult(plugin, 'Finished', [])
+        return invoke
+
+    def getVariables(self, plugin: str) -> dict:
+        return self._variables.pop(plugin)
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'manifest.yaml').write_text(MANIFEST)
+    def configure(**variables):
+        (tmp_path / 'config.yaml').write_text(''.join(f'{key}: {value}\n' for key, value in variables.items()))
+    return tmp_path, configure
+
+def run(path, cache: IncrementalCache, plugins: Plugins) -> dict:
+    options = {
+        'manifest': str(path / 'manifest.yaml'),
+        'verbosity': 'ERROR',
+        'steps': '["run:all"]',
+        'configFiles': repr([str(path / 'config.yaml')]),
+        'extraVariables': '{}',
+        'outputContext': None
+    }
+    bag = BagOfVariables(logging.getLogger('tests'), options)
+    cache.reset()
+    assert OrchestratorEngine(options=options, plugins=plugins, incremental=cache, bagOfVariables=bag).start() == 'Finished'
+    return bag._variables
+
+def task(parameters: dict, condition: str = None):
+    return SimpleNamespace(name='echo', parameters=parameters, condition=condition)
+
+@pytest.mark.parametrize('store', ['memory', 'sqlite'])
+def test_fingerprint_only_depends_on_the_referenced_variables(store):
+    variables = VariableStore.create(store)
+    variables.index('name', 'app-${{ version }}')
+    variables.index('version', '1')
+    variables.index('other', 'x')
+    view = lambda: variables.for_capability('build')
+    before = IncrementalCache.fingerprint(task({ 'target': '${{ name }}' }), view())
+    variables['other'] = VariableValue('y')
+    variables['unused'] = VariableValue('z')
+    assert IncrementalCache.fingerprint(task({ 'target': '${{ name }}' }), view()) == before
+    assert IncrementalCache.fingerprint(task({ 'target': '${{ name }}' }, "${{ other }} == 'y'"), view()) != before
+    assert IncrementalCache.fingerprint(task({ 'target': '${{ name }}', 'debug': True }), view()) != before
+    variables['name'] = VariableValue('app-2')
+    assert IncrementalCache.fingerprint(task({ 'target': '${{ name }}' }), view()) != before
+    variables.close()
+
+def test_fingerprint_sees_the_capability_variables():
+    variables = VariableStore.create('memory')
+    variables.index('deploy.region', 'west')
+    before = IncrementalCache.fingerprint(task({ 'region': '${{ region }}' }), variables.for_capability('deploy'))
+    variables['deploy.region'] = VariableValue('east')
+    assert IncrementalCache.fingerprint(task({ 'region': '${{ region }}' }), variables.for_capability('deploy')) != before
+
+def test_outputs_are_replayed_for_the_same_fingerprint():
+    cache = IncrementalCache()
+    key = cache.key('build', 'dotnet', 'run', SimpleNamespace(displayName='compile'))
+    variables = { 'a': VariableValue('1') }
+    before = cache.snapshot(variables)
+    variables['built'] = VariableValue('app.zip')
+    cache.store(key, 'same', before, variables)
+    assert cache.outputs(key, 'other') is None
+    assert cache.outputs(key, 'same')['built'].value == 'app.zip'
+    cache.discard(key)
+    assert cache.outputs(key, 'same') is None
+
+def test_keys_are_numbered_per_run():
+    cache = IncrementalCache()
+    compile = SimpleNamespace(displayName='compile')
+    assert [cache.key('build', 'dotnet', 'run', compile) for _ in range(2)] == ['build/dotnet/run/compile#0', 'build/dotnet/run/compile#1']
+    cache.reset()
+    assert cache.key('build', 'dotnet', 'run', compile) == 'build/dotnet/run/compile#0'
+
+def test_unchanged_tasks_are_skipped_and_their_outputs_replayed(project):
+    path, configure = project
+    cache, plugins = IncrementalCache(), Plugins()
+    configure(target='app', unrelated='1')
+    assert run(path, cache, plugins)['built'].value == 'app.zip'
+    assert plugins.calls == ['build', 'deploy']
+    # nothing the tasks reference changed: nothing runs, the output of build is still given to deploy
+    configure(target='app', unrelated='2')
+    assert run(path, cache, plugins)['built'].value == 'app.zip'
+    assert plugins.calls == ['build', 'deploy']
+    # build runs again, deploy too as its artifact changed
+    configure(target='lib', unrelated='2')
+    assert run(path, cache, plugins)['built'].value == 'lib.zip'
+    assert plugins.calls == ['build', 'deploy', 'build', 'deploy']
+
+def test_templates_are_walked_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'manifest.yaml').write_text('tasks:\n  - template: a.yaml\n  - template: b.yaml\n')
+    (tmp_path / 'a.yaml').write_text('tasks:\n  - template: b.yaml\n')
+    (tmp_path / 'b.yaml').write_text('tasks:\n  - template: a.yaml\n  - template: missing.yaml\n')
+    assert templates('manifest.yaml') == ['a.yaml', 'b.yaml', 'missing.yaml']
@@ -0,0 +1,114 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import shutil
+import pytest
+from lemniscat.runtime.engine import engine_watchdog
+from lemniscat.runtime.engine.engine_watchdog import TaskInterrupted, Watchdog, descendants
+
+_LOGGER = logging.getLogger('tests')
+_SLEEPER = f'{sys.executable} -c "import time; time.sleep(60)"'
+
+def running(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return False
+    return stat[stat.rindex(b')') + 2:].split()[0] != b'Z'
+
+def spawn() -> list:
+    """Start a shell and, through it, a grandchild the caller does not know about"""
+    process = subprocess.Popen(['sh', '-c', f'{_SLEEPER} & echo $!; wait'], stdout=subprocess.PIPE, text=True)
+    return [process.pid, int(process.stdout.readline())]
+
+def sleeping_task(started: list):
+    def task():
+        started.extend(spawn())
+        time.sleep(60)
+    return task
+
+@pytest.fixture(autouse=True)
+def no_process_left():
+    yield
+    for pid in descendants(os.getpid()):
+        os.kill(pid, signal.SIGKILL)
+
+def test_descendants_include_the_grandchildren():
+    assert set(spawn()) <= set(descendants(os.getpid()))
+
+@pytest.mark.skipif(shutil.which('ps') is None, reason='ps is not available')
+def test_descendants_without_proc(monkeypatch):
+    started = spawn()
+    isdir = os.path.isdir
+    monkeypatch.setattr(engine_watchdog.os.path, 'isdir', lambda path: path != '/proc' and isdir(path))
+    assert sorted(descendants(os.getpid())) == sorted(started)
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='process states are read from /proc')
+def test_timeout_interrupts_the_task_and_terminates_its_processes():
+    started = []
+    begin = time.monotonic()
+    with pytest.raises(TaskInterrupted, match='Timed out'):
+        Watchdog(_LOGGER).run('sleep', 0.5, sleeping_task(started))
+    assert time.monotonic() - begin < 10
+    assert len(started) == 2
+    assert not any(running(pid) for pid in started)
+
+def test_result_and_errors_are_given_back():
+    watchdog = Watchdog(_LOGGER)
+    assert watchdog.run('add', 5, lambda a, b: a + b, a=1, b=2) == 3
+    with pytest.raises(ValueError):
+        watchdog.run('fail', None, lambda: int('x'))
+
+def test_cancelled_watchdog_refuses_the_next_task():
+    watchdog = Watchdog(_LOGGER)
+    watchdog.cancel('Cancelled by the coordinator')
+    calls = []
+    with pytest.raises(TaskInterrupted, match='Cancelled by the coordinator'):
+        watchdog.run('next', None, lambda: calls.append(1))
+    assert watchdog.cancelled and calls == []
+
+def test_no_time_left_refuses_the_task():
+    with pytest.raises(TaskInterrupted):
+        Watchdog(_LOGGER).run('late', 0, lambda: None)
+
+def test_cancel_interrupts_the_running_task():
+    watchdog = Watchdog(_LOGGER)
+    threading.Timer(0.3, watchdog.cancel, args=('stop',)).start()
+    with pytest.raises(TaskInterrupted, match='stop'):
+        watchdog.run('sleep', None, lambda: time.sleep(30))
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='process states are read from /proc')
+def test_task_outside_the_main_thread_is_left_behind_without_its_processes():
+    started, outcome = [], {}
+    def run() -> None:
+        try:
+            Watchdog(_LOGGER).run('sleep', 0.5, sleeping_task(started))
+        except TaskInterrupted as e:
+            outcome['reason'] = e.reason
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(15)
+    assert outcome['reason'].startswith('Timed out')
+    assert len(started) == 2
+    assert not any(running(pid) for pid in started)
+
+def test_stuck_task_gets_the_process_killed(tmp_path):
+    script = tmp_path / 'stuck.py'
+    script.write_text('\n'.join([
+        'import logging, time',
+        'from lemniscat.runtime.engine.engine_watchdog import Watchdog',
+        'def stuck():',
+        '    while(True):',
+        '        try:',
+        '            time.sleep(30)',
+        '        except BaseException:',
+        '            pass',
+        "Watchdog(logging.getLogger('tests'), grace=0.5).run('stuck', 0.2, stuck)"
+    ]))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    assert subprocess.run([sys.executable, str(script)], env=environment, timeout=30).returncode == 124
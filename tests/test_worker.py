@@ -0,0 +1,110 @@
+import datetime
+import logging
+import socket
+import threading
+import pytest
+from lemniscat.core.model.models import VariableValue
+from lemniscat.runtime.engine.engine_worker import (WorkerClient, WorkerServer, changed_variables, decode_index, decode_variables,
+    encode_index, encode_variables, parse_address, receive_message, send_message, snapshot_value)
+
+_LOGGER = logging.getLogger('tests')
+
+def test_parse_address():
+    assert parse_address('unix:/tmp/lem.sock') == (socket.AF_UNIX, '/tmp/lem.sock')
+    assert parse_address('tcp:agent:4700') == (socket.AF_INET, ('agent', 4700))
+    assert parse_address(':4700') == (socket.AF_INET, ('127.0.0.1', 4700))
+
+def test_message_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        message = { 'type': 'run', 'variables': { 'a': 'é' * 1000 } }
+        send_message(left, message)
+        assert receive_message(right) == message
+
+def test_message_over_limit_is_refused():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, { 'token': 'x' * 100 })
+        with pytest.raises(ValueError):
+            receive_message(right, limit=10)
+
+def test_variables_round_trip():
+    variables = { 'a': VariableValue('1'), 'secret': VariableValue({ 'k': [1, 2] }, True) }
+    decoded = decode_variables(encode_variables(variables))
+    assert { key: (variable.value, variable.sensitive) for key, variable in decoded.items() } == { 'a': ('1', False), 'secret': ({ 'k': [1, 2] }, True) }
+
+def test_values_json_does_not_know_are_sent_as_strings():
+    # e.g. a date read from a YAML config file
+    variables = { 'day': VariableValue(datetime.date(2024, 1, 31)) }
+    assert decode_variables(encode_variables(variables))['day'].value == '2024-01-31'
+    assert decode_index(encode_index({ 'day': datetime.date(2024, 1, 31), 'raw': '${{ a }}' })) == { 'day': '2024-01-31', 'raw': '${{ a }}' }
+
+def test_changed_variables():
+    variables = { 'same': VariableValue('1'), 'changed': VariableValue('2') }
+    before = { key: snapshot_value(variable) for key, variable in variables.items() }
+    variables['changed'] = VariableValue('3')
+    variables['added'] = VariableValue('4', True)
+    assert sorted(changed_variables(before, variables)) == ['added', 'changed']
+
+@pytest.fixture
+def worker(tmp_path):
+    address = f'unix:{tmp_path}/worker.sock'
+    server = WorkerServer(_LOGGER, address, { 'verbosity': 'ERROR', 'token': 'secret' })
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return address
+
+def test_worker_serves_the_token_holder(worker):
+    assert WorkerClient(worker, timeout=5, token='secret').ping()
+    with WorkerClient(worker, timeout=5, token='secret') as client:
+        response = client.request({ 'type': 'unknown' })
+    assert response['status'] == 'Failed'
+
+def test_worker_refuses_a_wrong_token(worker):
+    assert not WorkerClient(worker, timeout=5, token='wrong').ping()
+    with pytest.raises(PermissionError):
+        with WorkerClient(worker, timeout=5, token='wrong'):
+            pass
+
+def exchange(address, *messages):
+    """Send raw messages to a worker and return its responses"""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        connection.settimeout(5)
+        connection.connect(address[len('unix:'):])
+        responses = []
+        for message in messages:
+            send_message(connection, message)
+            responses.append(receive_message(connection))
+        return responses
+
+@pytest.mark.parametrize('hello', [[], 'auth', None, { 'token': 'secret' }, { 'type': 'auth', 'token': ['secret'] }])
+def test_worker_survives_a_malformed_authentication(worker, hello):
+    assert exchange(worker, hello)[0]['status'] == 'Failed'
+    assert WorkerClient(worker, timeout=5, token='secret').ping()
+
+@pytest.mark.parametrize('request_', [[], {}, { 'type': None }, { 'type': 'run' }, { 'type': 'run', 'capability': 'build', 'solution': [],
+    'steps': [], 'requirements': [], 'variables': {} }])
+def test_worker_survives_a_malformed_request(worker, request_):
+    auth, response = exchange(worker, { 'type': 'auth', 'token': 'secret' }, request_)
+    assert (auth['status'], response['status']) == ('ok', 'Failed')
+    assert WorkerClient(worker, timeout=5, token='secret').ping()
+
+def test_worker_survives_an_undecodable_request(worker):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        connection.settimeout(5)
+        connection.connect(worker[len('unix:'):])
+        send_message(connection, { 'type': 'auth', 'token': 'secret' })
+        assert receive_message(connection)['status'] == 'ok'
+        connection.sendall(b'\x00\x00\x00\x00\x00\x00\x00\x02\xff\xfe')
+        assert connection.recv(1) == b''
+    assert WorkerClient(worker, timeout=5, token='secret').ping()
+
+def test_worker_requires_a_token(tmp_path, monkeypatch):
+    monkeypatch.delenv('LEM_WORKER_TOKEN', raising=False)
+    with pytest.raises(ValueError):
+        WorkerServer(_LOGGER, f'unix:{tmp_path}/worker.sock', { 'verbosity': 'ERROR' })
+
+def test_tcp_worker_requires_tls():
+    with pytest.raises(ValueError):
+        WorkerServer(_LOGGER, '127.0.0.1:0', { 'verbosity': 'ERROR', 'token': 'secret' })